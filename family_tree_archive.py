@@ -0,0 +1,68 @@
+"""
+On-disk archive for people evicted from a simulation's working set.
+
+Once someone has died they take no further part in the simulation, so their
+free text fields (email, phone, address, place of birth) are moved to an SQLite file and
+only read back when the tree is exported, as are marriages once they have
+ended. The fixed-width columns of the person store stay in memory, so person
+IDs, parent links and the traits children inherit keep working without
+touching the disk.
+"""
+
+import os
+import sqlite3
+
+from family_tree_store import TEXT_COLUMNS
+
+
+class PersonArchive:
+    """SQLite tables of the free text fields of evicted people, keyed by person ID,
+    and of ended marriages, keyed by marriage index"""
+
+    def __init__(self, path, reset=True):
+        if reset and os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # A scratch file: a crash loses nothing the simulation cannot rebuild
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS archived_person "
+            f"(person_id INTEGER PRIMARY KEY, {', '.join(TEXT_COLUMNS)})")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS archived_marriage "
+            "(marriage_index INTEGER PRIMARY KEY, person1_id, person2_id, year)")
+
+    def add(self, rows):
+        """Store (person_id, *text fields) rows"""
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO archived_person VALUES "
+            f"({', '.join('?' * (len(TEXT_COLUMNS) + 1))})", rows)
+        self.conn.commit()
+
+    def get(self, person_id):
+        """Archived text fields of a person as a dict, None if not archived"""
+        row = self.conn.execute(
+            f"SELECT {', '.join(TEXT_COLUMNS)} FROM archived_person WHERE person_id = ?",
+            (person_id,)).fetchone()
+        return dict(zip(TEXT_COLUMNS, row)) if row else None
+
+    def add_marriages(self, rows):
+        """Store (marriage index, person1_id, person2_id, year) rows of ended marriages"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO archived_marriage VALUES (?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def get_marriage(self, marriage_index):
+        """Archived marriage as a marriage record, None if not archived"""
+        row = self.conn.execute(
+            "SELECT person1_id, person2_id, year FROM archived_marriage "
+            "WHERE marriage_index = ?", (marriage_index,)).fetchone()
+        if not row:
+            return None
+        person1_id, person2_id, year = row
+        return {'person1_id': person1_id, 'person2_id': person2_id, 'year': year,
+                'current': False}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,353 @@
+"""
+Event-driven simulation engine for the family tree generator.
+
+Instead of re-scanning the whole population every simulated year, state
+changes are kept in a priority queue keyed by year: coming of age, start and
+end of fertility, death, marriage proposals, divorces and births. Each year
+only the events due in that year are processed, so the cost of a year is
+proportional to the activity in it rather than to the number of people ever
+created.
+
+Yearly probabilities from the generator are turned into waiting times
+(geometric draws), so the populations produced are statistically equivalent
+to the classic engine's, not identical for a given seed.
+"""
+
+import heapq
+import math
+
+PROB_PROPOSAL = 0.1  # Yearly chance for an unmarried adult to look for a spouse
+PROB_MARRIED_BIRTH = 0.2  # Yearly chance of a child for a fertile married couple
+MAX_CHILDREN_PER_MOTHER = 10
+
+# Event kinds, in the order they are processed within a year
+DEATH = 0
+FERTILITY_END = 1
+FERTILITY_START = 2
+COMING_OF_AGE = 3
+MARRIAGE_START = 4
+PROPOSAL = 5
+DIVORCE = 6
+MARRIED_BIRTH = 7
+SINGLE_BIRTH = 8
+
+
+def next_event_year(rng, year, probability):
+    """First year from `year` on in which an event with the given yearly probability happens"""
+    return year + int(math.log(1.0 - rng.random()) / math.log(1.0 - probability))
+
+
+class RandomAccessSet:
+    """Set supporting O(1) add, discard and uniform random choice"""
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng):
+        return self.items[rng.randrange(len(self.items))]
+
+
+class EventDrivenEngine:
+    """Runs the yearly simulation from a queue of scheduled events"""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.people = sim.people
+        self.rng = sim.rng
+        self.queue = []
+        self.sequence = 0  # Tie breaker keeping the queue order deterministic
+        self.registered = 0  # People before this ID have their events scheduled
+        # Unmarried living adults, bucketed by sex and birth year
+        self.singles = {'M': {}, 'F': {}}
+        self.fertile_men = RandomAccessSet()
+        # Bumped whenever a person's proposal schedule is replaced
+        self.proposal_tokens = {}
+
+    def next_event_year(self, year, probability):
+        return next_event_year(self.rng, year, probability)
+
+    def schedule(self, year, kind, subject, token=None):
+        """Queue an event, dropping those that fall after the simulated period"""
+        if year < self.sim.CURRENT_YEAR:
+            heapq.heappush(self.queue, (year, kind, self.sequence, subject, token))
+            self.sequence += 1
+
+    # Population bookkeeping
+
+    def add_single(self, pid, year):
+        """Make a person a marriage candidate and schedule their next proposal"""
+        self.singles[self.people.sex[pid]].setdefault(self.people.birth_year[pid], {})[pid] = None
+        token = self.proposal_tokens.get(pid, 0) + 1
+        self.proposal_tokens[pid] = token
+        self.schedule(self.next_event_year(year, PROB_PROPOSAL), PROPOSAL, pid, token)
+
+    def remove_single(self, pid):
+        buckets = self.singles[self.people.sex[pid]]
+        birth_year = self.people.birth_year[pid]
+        bucket = buckets.get(birth_year)
+        if bucket and pid in bucket:
+            del bucket[pid]
+            if not bucket:
+                del buckets[birth_year]
+
+    def is_single(self, pid):
+        return pid in self.singles[self.people.sex[pid]].get(self.people.birth_year[pid], ())
+
+    def register_person(self, pid, year):
+        """Set up the state of a person as of `year` and schedule their future events"""
+        if not self.sim.is_alive(pid, year):
+            return
+
+        birth_year = self.people.birth_year[pid]
+        age = year - birth_year
+        male = self.people.sex[pid] == 'M'
+        fertility_end = (self.sim.FERTILITY_END_AGE_MALE if male
+                         else self.sim.FERTILITY_END_AGE_FEMALE)
+
+        if self.people.is_deceased[pid]:
+            # Alive through the year of death
+            self.schedule(self.people.death_year[pid] + 1, DEATH, pid)
+
+        if age < self.sim.FERTILITY_START_AGE:
+            self.schedule(birth_year + self.sim.FERTILITY_START_AGE, FERTILITY_START, pid)
+        elif age <= fertility_end:
+            self.start_fertility(pid, year)
+        if age <= fertility_end:
+            self.schedule(birth_year + fertility_end + 1, FERTILITY_END, pid)
+
+        if age < self.sim.MARRIAGE_MIN_AGE:
+            self.schedule(birth_year + self.sim.MARRIAGE_MIN_AGE, COMING_OF_AGE, pid)
+        elif not self.sim.is_married(pid, year):
+            self.add_single(pid, year)
+
+    def register_new_people(self, year):
+        """Schedule events for everyone created since the last call"""
+        for pid in range(self.registered, len(self.people)):
+            self.register_person(pid, year)
+        self.registered = len(self.people)
+
+    def start_fertility(self, pid, year):
+        if not self.sim.can_have_children(pid):
+            return
+        if self.people.sex[pid] == 'M':
+            self.fertile_men.add(pid)
+        else:
+            self.schedule(self.next_event_year(year, self.sim.PROB_OUT_OF_WEDLOCK / 10),
+                          SINGLE_BIRTH, pid)
+
+    def schedule_marriage(self, marriage_index, year):
+        """Schedule the divorce and first child of a marriage that starts in `year`"""
+        self.schedule(self.next_event_year(year + 1, self.sim.PROB_DIVORCE / 50), DIVORCE,
+                      marriage_index)
+        self.schedule(self.next_event_year(year + 1, PROB_MARRIED_BIRTH), MARRIED_BIRTH,
+                      marriage_index)
+
+    # Event handlers
+
+    def on_death(self, pid, year):
+        self.remove_single(pid)
+        self.fertile_men.discard(pid)
+
+    def on_fertility_start(self, pid, year):
+        if self.sim.is_alive(pid, year):
+            self.start_fertility(pid, year)
+
+    def on_fertility_end(self, pid, year):
+        self.fertile_men.discard(pid)
+
+    def on_coming_of_age(self, pid, year):
+        if self.sim.is_alive(pid, year) and not self.sim.is_married(pid, year):
+            self.add_single(pid, year)
+
+    def on_marriage_start(self, marriage_index, year):
+        """A marriage registered ahead of time (initial population) takes effect"""
+        marriage = self.sim.active_marriages.get(marriage_index)
+        if marriage is not None:
+            self.remove_single(marriage['person1_id'])
+            self.remove_single(marriage['person2_id'])
+
+    def on_proposal(self, pid, year, token):
+        if token != self.proposal_tokens.get(pid) or not self.is_single(pid):
+            return
+
+        if self.sim.looks_outside(pid):
+            self.remove_single(pid)
+            return
+        candidates = self.find_spouse_candidates(pid, year)
+        if candidates:
+            spouse_id = self.rng.choice(candidates)
+            if self.sim.simulate_marriage(pid, spouse_id, year):
+                self.remove_single(pid)
+                self.remove_single(spouse_id)
+                self.schedule_marriage(len(self.sim.marriages) - 1, year)
+                return
+        elif self.sim.propose_outside(pid):
+            # Off the market until the search outside is settled
+            self.remove_single(pid)
+            return
+
+        token += 1
+        self.proposal_tokens[pid] = token
+        self.schedule(self.next_event_year(year + 1, PROB_PROPOSAL), PROPOSAL, pid, token)
+
+    def find_spouse_candidates(self, pid, year):
+        """Unmarried living adults of the opposite sex within the allowed age gap"""
+        birth_year = self.people.birth_year[pid]
+        sex = 'F' if self.people.sex[pid] == 'M' else 'M'
+        max_age_diff = self.sim.max_spouse_age_gap(year)
+        last_birth_year = min(birth_year + max_age_diff, year - self.sim.MARRIAGE_MIN_AGE)
+
+        buckets = self.singles[sex]
+        candidates = [
+            candidate
+            for candidate_birth_year in range(birth_year - max_age_diff, last_birth_year + 1)
+            for candidate in buckets.get(candidate_birth_year, ())
+        ]
+
+        if year < 1970 and sex == 'F':
+            # Allow polygamy for males in older times
+            candidates.extend(
+                candidate
+                for candidate in self.sim.find_living_by_birth_year(
+                    sex, birth_year - max_age_diff, last_birth_year, year)
+                if (self.sim.is_married(candidate, year) and
+                    self.rng.random() < self.sim.PROB_POLYGAMY)
+            )
+        if self.sim.RELATIVE_EXCLUSION_GENERATIONS:
+            candidates = [candidate for candidate in candidates
+                          if not self.sim.is_close_relative(pid, candidate)]
+        return candidates
+
+    def on_divorce(self, marriage_index, year):
+        marriage = self.sim.active_marriages.get(marriage_index)
+        if marriage is None:
+            return
+
+        self.sim.end_marriage(marriage_index)
+        for pid in (marriage['person1_id'], marriage['person2_id']):
+            if self.sim.is_alive(pid, year) and not self.sim.is_married(pid, year):
+                self.add_single(pid, year + 1)
+
+    def on_married_birth(self, marriage_index, year):
+        marriage = self.sim.active_marriages.get(marriage_index)
+        if marriage is None:
+            return
+
+        p1_id, p2_id = marriage['person1_id'], marriage['person2_id']
+        father_id = p1_id if self.people.sex[p1_id] == 'M' else p2_id
+        mother_id = p1_id if self.people.sex[p1_id] == 'F' else p2_id
+
+        mother_age = year - self.people.birth_year[mother_id]
+        if (not self.sim.is_alive(mother_id, year) or
+                mother_age > self.sim.FERTILITY_END_AGE_FEMALE):
+            return
+        if mother_age < self.sim.FERTILITY_START_AGE:
+            fertility_start = self.people.birth_year[mother_id] + self.sim.FERTILITY_START_AGE
+            self.schedule(self.next_event_year(fertility_start, PROB_MARRIED_BIRTH),
+                          MARRIED_BIRTH, marriage_index)
+            return
+        if len(self.sim.children_map.get(mother_id, ())) >= MAX_CHILDREN_PER_MOTHER:
+            return
+        if not (self.sim.can_have_children(mother_id) and self.sim.can_have_children(father_id)):
+            return
+
+        self.sim.simulate_child(father_id, mother_id, year)
+        self.schedule(self.next_event_year(year + 1, PROB_MARRIED_BIRTH), MARRIED_BIRTH,
+                      marriage_index)
+
+    def on_single_birth(self, mother_id, year):
+        if (not self.sim.is_alive(mother_id, year) or
+                year - self.people.birth_year[mother_id] > self.sim.FERTILITY_END_AGE_FEMALE):
+            return
+
+        if self.rng.random() < self.sim.PROB_UNKNOWN_FATHER or not self.fertile_men:
+            father_birth_year = self.people.birth_year[mother_id] + self.rng.randint(-5, 5)
+            father_id = self.sim.create_unknown_parent(
+                is_male=True, birth_year=father_birth_year,
+                generation=self.people.generation[mother_id])
+        else:
+            father_id = self.fertile_men.choice(self.rng)
+
+        self.sim.simulate_child(father_id, mother_id, year)
+        self.schedule(self.next_event_year(year + 1, self.sim.PROB_OUT_OF_WEDLOCK / 10),
+                      SINGLE_BIRTH, mother_id)
+
+    def run(self, until=None):
+        years = self.sim.simulated_years(until)
+        first_year = years.start
+        self.register_new_people(first_year)
+
+        # Marriages registered so far (initial population) may start in the future
+        for marriage_index, marriage in self.sim.active_marriages.items():
+            if marriage['year'] > first_year:
+                self.schedule(marriage['year'], MARRIAGE_START, marriage_index)
+            self.schedule_marriage(marriage_index, max(marriage['year'], first_year - 1))
+
+        handlers = {
+            DEATH: self.on_death,
+            FERTILITY_END: self.on_fertility_end,
+            FERTILITY_START: self.on_fertility_start,
+            COMING_OF_AGE: self.on_coming_of_age,
+            MARRIAGE_START: self.on_marriage_start,
+            DIVORCE: self.on_divorce,
+            MARRIED_BIRTH: self.on_married_birth,
+            SINGLE_BIRTH: self.on_single_birth,
+        }
+
+        for current_year in years:
+            if self.sim.target_population and len(self.people) >= self.sim.target_population:
+                print(f"Reached the target population of {self.sim.target_population} "
+                      f"in {current_year}")
+                break
+
+            self.sim.prune_candidate_index(current_year)
+
+            while self.queue and self.queue[0][0] <= current_year:
+                _, kind, _, subject, token = heapq.heappop(self.queue)
+                if kind == PROPOSAL:
+                    self.on_proposal(subject, current_year, token)
+                else:
+                    handlers[kind](subject, current_year)
+                # People created by the event join from the next year on
+                self.register_new_people(current_year + 1)
+
+            # Create orphans and children with unknown parents
+            # 5% chance each year to add an orphan, split between the shards of a parallel run
+            if self.rng.random() < 0.05 * (1 - self.sim.outside_share):
+                self.sim.create_orphan(current_year)
+            self.register_new_people(current_year + 1)
+        else:
+            self.sim.pause(until)
+
+
+def simulate_generations_events(sim, num_generations=3, until=None):
+    """Event-driven counterpart of FamilySimulation.simulate_generations
+
+    People who cannot have children within `num_generations` get no birth
+    events, so lineages that reach it simply stop producing events. After a
+    pause (`until`), the next call schedules everyone's events afresh, which
+    the geometric waiting times allow without changing the statistics.
+    """
+    sim.num_generations = num_generations
+    EventDrivenEngine(sim).run(until)
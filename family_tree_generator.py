@@ -1,8 +1,16 @@
-import json
+import os
+import pickle
 import random
-import uuid
-import names
+from contextlib import nullcontext
 from faker import Faker
+from family_tree_ids import IdFactory, ID_SCHEMES
+from family_tree_names import NameSampler
+from family_tree_pools import AttributePools
+from family_tree_profile import PhaseProfiler, TimedSource
+from family_tree_archive import PersonArchive
+from family_tree_kinship import KinshipEngine
+from family_tree_writer import write_family_tree
+from family_tree_store import PersonStore, NO_PERSON, parse_date
 
 fake = Faker()
 
@@ -14,6 +22,7 @@ MARRIAGE_MIN_AGE = 18
 FERTILITY_START_AGE = 16
 FERTILITY_END_AGE_FEMALE = 45
 FERTILITY_END_AGE_MALE = 70
+GENERATION_YEARS = 25  # Birth years per generation, for people without known parents
 
 # Probabilities
 PROB_UNKNOWN_FATHER = 0.15
@@ -25,6 +34,13 @@ PROB_OUT_OF_WEDLOCK = 0.2
 PROB_DEATH_YEARLY = 0.01  # Base probability increases with age
 PROB_MIGRATION = 0.1
 
+# Spouses with a common ancestor this many generations back are not matched
+# (1 excludes siblings, 2 also first cousins, ...), 0 allows anyone
+RELATIVE_EXCLUSION_GENERATIONS = 0
+
+# Simulation engines selectable in create_family_tree
+ENGINES = ['classic', 'numpy', 'events']
+
 # Diversity parameters
 BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
 BLOOD_TYPE_DIST = [0.34, 0.06, 0.08, 0.02, 0.03, 0.01,
@@ -37,582 +53,1318 @@ ETHNICITIES = ['Caucasian', 'African', 'Hispanic',
                'Asian', 'Middle Eastern', 'Mixed']
 RELIGIONS = ['Christianity', 'Islam', 'Hinduism',
              'Buddhism', 'Judaism', 'None', 'Other']
+EDUCATION_LEVELS = ["High School", "Some College", "Bachelor's Degree",
+                    "Master's Degree", "Ph.D.", "Trade School", "None"]
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'outlook.com', 'hotmail.com']
+CAUSES_OF_DEATH = ["Natural causes", "Heart disease", "Cancer", "Accident",
+                   "Respiratory disease", "Stroke", "Complications from surgery",
+                   "Unknown", "Infectious disease", "War/conflict"]
+
+
+class FamilySimulation:
+    """State, random number generators and settings of one family tree simulation
+
+    Every simulation owns its people and relationships, so any number of trees
+    can be generated in one process. Settings default to the module constants
+    and can be overridden per simulation, e.g. FamilySimulation(current_year=2000).
+    """
+
+    START_YEAR = START_YEAR
+    CURRENT_YEAR = CURRENT_YEAR
+    MAX_AGE = MAX_AGE
+    MARRIAGE_MIN_AGE = MARRIAGE_MIN_AGE
+    FERTILITY_START_AGE = FERTILITY_START_AGE
+    FERTILITY_END_AGE_FEMALE = FERTILITY_END_AGE_FEMALE
+    FERTILITY_END_AGE_MALE = FERTILITY_END_AGE_MALE
+    GENERATION_YEARS = GENERATION_YEARS
+    PROB_UNKNOWN_FATHER = PROB_UNKNOWN_FATHER
+    PROB_UNKNOWN_MOTHER = PROB_UNKNOWN_MOTHER
+    PROB_REMARRIAGE = PROB_REMARRIAGE
+    PROB_DIVORCE = PROB_DIVORCE
+    PROB_POLYGAMY = PROB_POLYGAMY
+    PROB_OUT_OF_WEDLOCK = PROB_OUT_OF_WEDLOCK
+    PROB_DEATH_YEARLY = PROB_DEATH_YEARLY
+    PROB_MIGRATION = PROB_MIGRATION
+    RELATIVE_EXCLUSION_GENERATIONS = RELATIVE_EXCLUSION_GENERATIONS
+    BLOOD_TYPES = BLOOD_TYPES
+    BLOOD_TYPE_DIST = BLOOD_TYPE_DIST
+    EYE_COLORS = EYE_COLORS
+    HAIR_COLORS = HAIR_COLORS
+    NATIONALITIES = NATIONALITIES
+    ETHNICITIES = ETHNICITIES
+    RELIGIONS = RELIGIONS
+    EDUCATION_LEVELS = EDUCATION_LEVELS
+    EMAIL_DOMAINS = EMAIL_DOMAINS
+    CAUSES_OF_DEATH = CAUSES_OF_DEATH
+
+    def __init__(self, seed=None, name_source=None, attribute_pool_size=None,
+                 attribute_seed=None, lazy_attributes=False, batch_attributes=False,
+                 checkpoint_path=None, checkpoint_interval=10, id_scheme='uuid4',
+                 evict_path=None, **settings):
+        """Create an empty simulation
+
+        Without a seed the global `random` module and the shared Faker instance
+        are used, so random.seed() and Faker.seed() make runs reproducible.
+        `name_source` provides get_first_name/get_last_name (such as the `names`
+        module), by default a cached NameSampler drawing from the simulation RNG.
+        With `attribute_pool_size`, cities, countries, addresses and jobs come
+        from AttributePools of that size instead of live Faker calls. With
+        `lazy_attributes`, people are created with their structural fields only
+        and fill_attributes draws the rest, as NumPy batches from the pools
+        with `batch_attributes`. They use `attribute_seed`, by default the
+        simulation seed or else a random one. With
+        `checkpoint_path`, the classic engine saves a snapshot there every
+        `checkpoint_interval` simulated years (none for 0 or None). Exported IDs follow `id_scheme`,
+        one of family_tree_ids.ID_SCHEMES. With `evict_path`, the free text
+        fields of people who died are moved to a PersonArchive at that path
+        and read back on export (see prune_candidate_index).
+        """
+        if seed is None:
+            self.rng = random
+            self.fake = fake
+        else:
+            self.rng = random.Random(seed)
+            self.fake = Faker()
+            self.fake.seed_instance(seed)
+        self.names = name_source or NameSampler(self.rng)
+        self.attribute_pool_size = attribute_pool_size
+        self.lazy_attributes = lazy_attributes
+        if batch_attributes and not lazy_attributes:
+            raise ValueError("Batch attributes are drawn after the simulation, "
+                             "they require lazy attributes")
+        self.batch_attributes = batch_attributes
+        if attribute_seed is None:
+            attribute_seed = seed if seed is not None else random.SystemRandom().getrandbits(32)
+        self.attribute_seed = attribute_seed
+        if attribute_pool_size:
+            self.fake = AttributePools(attribute_pool_size, attribute_seed)
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        if id_scheme not in ID_SCHEMES:
+            raise ValueError(f"Unknown ID scheme '{id_scheme}', expected one of {ID_SCHEMES}")
+        self.id_scheme = id_scheme
+        self.resume_year = None  # Year to continue from when loaded from a checkpoint
+        self.profiler = None  # PhaseProfiler of the yearly loop, see enable_profiling
+        self.evict_path = evict_path
+        self.archive = PersonArchive(evict_path) if evict_path else None
+        # Children are only born up to this generation (founders are generation 1)
+        self.num_generations = None
+        self.target_population = None  # The yearly simulation stops once reached
+        # Exported IDs of people loaded from an existing dataset, who keep them
+        self.loaded_ids = []
+        self.loaded_legacy_bucket_ids = []
+
+        for name, value in settings.items():
+            if not hasattr(FamilySimulation, name.upper()):
+                raise ValueError(f"Unknown simulation setting '{name}'")
+            setattr(self, name.upper(), value)
+
+        # For storing people (indexed by dense integer IDs)
+        self.people = PersonStore()
+        # For tracking relationships
+        self.marriages = []  # None for ended marriages moved to the archive when evicting
+        self.children_map = {}  # Maps parent IDs to their children (living ones when evicting)
+        self.ended_marriages = []  # Indexes of the marriages to archive at the next pruning
+        # Marriage registry so marital status checks are lookups instead of list scans
+        self.current_marriages = {}  # Maps person IDs to the indexes of their current marriages
+        self.active_marriages = {}  # Maps marriage indexes to marriage records (insertion-ordered set)
+        # Candidate index so spouse and father searches are birth-year range queries.
+        # Buckets are dicts used as insertion-ordered sets, so they keep creation order.
+        self.candidate_index = {'M': {}, 'F': {}}  # Maps sex -> birth year -> living person IDs
+        self.deaths_by_year = {}  # Maps death years to the indexed people who die in them
+        # Indexed people who have not died yet, in creation order (insertion-ordered set);
+        # the yearly scan only visits them
+        self.working_set = {}
+        self._kinship = None  # KinshipEngine over the people, see is_close_relative
+        # Share of the population living outside this simulation (the other shards
+        # of a parallel run); that share of spouse searches looks there, see looks_outside
+        self.outside_share = 0.0
+        self.outside_proposals = {}  # People who looked outside (insertion-ordered set)
+        # Maps people who came from the outside to their near ancestors there (keys
+        # other than person IDs) and their generations back, see is_close_relative
+        self.outside_ancestors = {}
+
+    def enable_profiling(self):
+        """Record per-phase timings of the classic engine's yearly loop in self.profiler
+
+        Faker and name calls are timed as the 'faker' and 'names' phases.
+        """
+        self.profiler = PhaseProfiler()
+        self.fake = TimedSource(self.fake, self.profiler, 'faker')
+        self.names = TimedSource(self.names, self.profiler, 'names')
+
+    def phase(self, name, size=None):
+        """Context timing a phase of the yearly loop when profiling"""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name, size)
+
+    def create_date(self, year, randomize=True):
+        """Create a (year, month, day) date with optional randomization within the year"""
+        if randomize:
+            month = self.rng.randint(1, 12)
+            max_day = 28 if month == 2 else 30 if month in [4, 6, 9, 11] else 31
+            day = self.rng.randint(1, max_day)
+        else:
+            month, day = 1, 1
 
-# For storing people
-people = {}
-# For tracking relationships
-marriages = []
-children_map = {}  # Maps parent IDs to their children
-
-
-def create_date(year, randomize=True):
-    """Create a date with optional randomization within the year"""
-    if randomize:
-        month = random.randint(1, 12)
-        max_day = 28 if month == 2 else 30 if month in [4, 6, 9, 11] else 31
-        day = random.randint(1, max_day)
-    else:
-        month, day = 1, 1
-
-    return f"{year}-{month:02d}-{day:02d}"
-
+        return year, month, day
 
-def random_age_death(birth_year, is_deceased=None):
-    """Calculate if a person has died based on their birth year and determine death details"""
-    age = CURRENT_YEAR - birth_year
+    def random_age_death(self, birth_year, is_deceased=None):
+        """Calculate if a person has died based on their birth year and determine death details"""
+        age = self.CURRENT_YEAR - birth_year
 
-    # Force death for very old people
-    if age > MAX_AGE:
-        is_deceased = True
+        # Force death for very old people
+        if age > self.MAX_AGE:
+            is_deceased = True
 
-    # If we don't know if they're deceased, calculate probability
-    if is_deceased is None:
-        yearly_prob = PROB_DEATH_YEARLY
-        # Increase probability for older people
-        if age > 70:
-            yearly_prob += (age - 70) * 0.01
+        # If we don't know if they're deceased, calculate probability
+        if is_deceased is None:
+            yearly_prob = self.PROB_DEATH_YEARLY
+            # Increase probability for older people
+            if age > 70:
+                yearly_prob += (age - 70) * 0.01
 
-        is_deceased = random.random() < yearly_prob * age
+            is_deceased = self.rng.random() < yearly_prob * age
 
-    if is_deceased and age > 0:
-        # Most likely to die in later years
-        if age > 75:
-            death_age = random.randint(
-                max(birth_year + 75, START_YEAR), min(birth_year + age, CURRENT_YEAR))
+        if is_deceased and age > 0:
+            # Most likely to die in later years
+            if age > 75:
+                death_age = self.rng.randint(
+                    max(birth_year + 75, self.START_YEAR), min(birth_year + age, self.CURRENT_YEAR))
+            else:
+                # Some chance of early death
+                death_age = self.rng.randint(
+                    birth_year + 1, min(birth_year + age, self.CURRENT_YEAR))
+
+            death_date = self.create_date(death_age)
+            cause = self.rng.choice(self.CAUSES_OF_DEATH)
+            return is_deceased, death_date, cause
+
+        return is_deceased, None, None
+
+    def create_person(
+        self,
+        birth_year=None,
+        father_id=None,
+        mother_id=None,
+        forced_gender=None,
+        is_deceased=None,
+        first_name=None,
+        last_name=None,
+        generation=None
+    ):
+        """Create a person with given or random attributes"""
+
+        # Generate or use provided birth year
+        if birth_year is None:
+            birth_year = self.rng.randint(self.START_YEAR, self.CURRENT_YEAR - 5)
+
+        # Generate sex/gender
+        sex = forced_gender if forced_gender else self.rng.choice(['M', 'F'])
+
+        # Generate names
+        if not first_name:
+            first_name = self.names.get_first_name(
+                gender='male' if sex == 'M' else 'female')
+
+        # For last name, use father's if available, otherwise generate
+        if not last_name and father_id in self.people:
+            last_name = self.people.last_name[father_id]
+        elif not last_name:
+            last_name = self.names.get_last_name()
+
+        middle_name = self.names.get_first_name(
+            gender='male' if sex == 'M' else 'female') if self.rng.random() < 0.7 else None
+
+        # Determine maiden name for females
+        maiden_name = None
+        if sex == 'F' and self.rng.random() < 0.8:
+            maiden_name = last_name  # Will be updated if the person marries
+
+        # Create birth date
+        _, birth_month, birth_day = self.create_date(birth_year)
+
+        # Determine death information
+        is_deceased, date_of_death, cause_of_death = self.random_age_death(
+            birth_year, is_deceased)
+
+        death_year, death_month, death_day = date_of_death or (0, 0, 0)
+
+        if self.lazy_attributes:
+            attributes = {}  # Drawn later by fill_attributes
+        else:
+            attributes = self._draw_attributes(
+                self.rng, sex, birth_year, is_deceased, first_name, last_name,
+                father_id, mother_id)
+
+        person_id = self.people.add(
+            first_name=first_name,
+            middle_name=middle_name,
+            last_name=last_name,
+            maiden_name=maiden_name,
+            birth_year=birth_year,
+            birth_month=birth_month,
+            birth_day=birth_day,
+            sex=sex,
+            death_year=death_year,
+            death_month=death_month,
+            death_day=death_day,
+            is_deceased=is_deceased,
+            cause_of_death=cause_of_death,
+            father_id=father_id,
+            mother_id=mother_id,
+            generation=generation or self.generation_of(birth_year, father_id, mother_id),
+            **attributes
+        )
+
+        self.index_person(person_id)
+        return person_id
+
+    def _draw_attributes(self, rng, sex, birth_year, is_deceased, first_name, last_name,
+                         father_id, mother_id):
+        """Draw the attributes of a person that the simulation itself never reads"""
+        # Physical characteristics - with some genetic influence
+        blood_type = rng.choices(self.BLOOD_TYPES, weights=self.BLOOD_TYPE_DIST)[0]
+
+        # Eye and hair color influenced by parents
+        eye_color = None
+        hair_color = None
+
+        if father_id in self.people and mother_id in self.people and rng.random() < 0.8:
+            # 80% chance to inherit from parents
+            eye_color = rng.choice(
+                [self.people.eye_color[father_id], self.people.eye_color[mother_id]])
+            hair_color = rng.choice(
+                [self.people.hair_color[father_id], self.people.hair_color[mother_id]])
+
+        if not eye_color:
+            eye_color = rng.choice(self.EYE_COLORS)
+        if not hair_color:
+            hair_color = rng.choice(self.HAIR_COLORS)
+
+        # Other attributes
+        height_cm = rng.randint(
+            150, 200) if sex == 'M' else rng.randint(145, 185)
+
+        # Generate plausible contact info based on birth year (older people less likely to have email)
+        email = None
+        age = self.CURRENT_YEAR - birth_year
+        if age >= 10 and age <= 90 and rng.random() < (0.9 - (age / 100)):
+            email = f"{first_name.lower()}.{last_name.lower()}@{rng.choice(self.EMAIL_DOMAINS)}"
+
+        # Phone more common than email
+        phone = None
+        if age >= 12 and rng.random() < (0.95 - (age / 200)):
+            phone = f"+1-{rng.randint(200, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+
+        # Cultural background - with some family influence
+        nationality = None
+        ethnicity = None
+        religion = None
+
+        if father_id in self.people and mother_id in self.people and rng.random() < 0.9:
+            # 90% chance to have same nationality as parents if both known
+            nationality = rng.choice(
+                [self.people.nationality[father_id], self.people.nationality[mother_id]])
+            ethnicity = rng.choice(
+                [self.people.ethnicity[father_id], self.people.ethnicity[mother_id]])
+            # 80% chance to follow parents' religion
+            if rng.random() < 0.8:
+                religion = rng.choice(
+                    [self.people.religion[father_id], self.people.religion[mother_id]])
+
+        if not nationality:
+            nationality = rng.choice(self.NATIONALITIES)
+        if not ethnicity:
+            ethnicity = rng.choice(self.ETHNICITIES)
+        if not religion:
+            religion = rng.choice(self.RELIGIONS)
+
+        # Location data
+        place_of_birth = self.fake.city() + ", " + self.fake.country()
+        address = self.fake.address() if not is_deceased and age >= 18 else None
+
+        # Education and occupation based on age
+        education = None
+        occupation = None
+
+        if age >= 18:
+            education = rng.choice(self.EDUCATION_LEVELS)
+
+            if not is_deceased or (is_deceased and age >= 22):
+                occupation = self.fake.job()
+
+        return {
+            'blood_type': blood_type,
+            'nationality': nationality,
+            'ethnicity': ethnicity,
+            'place_of_birth': place_of_birth,
+            'height_cm': height_cm,
+            'eye_color': eye_color,
+            'hair_color': hair_color,
+            'email': email,
+            'phone': phone,
+            'address': address,
+            'occupation': occupation,
+            'education': education,
+            'religion': religion,
+            # 30% have legacy content, its bucket ID is assigned at export
+            'has_legacy_bucket': rng.random() < 0.3,
+            'has_attributes': True
+        }
+
+    def fill_attributes(self, person_ids=None):
+        """Draw the attributes of people created by a lazy simulation
+
+        Fills everyone still missing them, or only the given people. Parents
+        are filled before their children, so inherited traits follow the
+        parent links. Each person draws from an RNG seeded with the attribute
+        seed and their ID, so values do not depend on which people are filled
+        or in what order (apart from cities, countries, addresses and jobs).
+        With batch_attributes, all of them are drawn at once by
+        fill_attributes_numpy instead, from one generator per call.
+        """
+        people = self.people
+        if person_ids is None:
+            pending = [pid for pid in range(len(people)) if not people.has_attributes[pid]]
         else:
-            # Some chance of early death
-            death_age = random.randint(
-                birth_year + 1, min(birth_year + age, CURRENT_YEAR))
-
-        death_date = create_date(death_age)
-        cause = random.choice([
-            "Natural causes", "Heart disease", "Cancer", "Accident",
-            "Respiratory disease", "Stroke", "Complications from surgery",
-            "Unknown", "Infectious disease", "War/conflict"
-        ])
-        return is_deceased, death_date, cause
-
-    return is_deceased, None, None
-
-
-def create_person(
-    birth_year=None,
-    father_id=None,
-    mother_id=None,
-    forced_gender=None,
-    is_deceased=None,
-    first_name=None,
-    last_name=None
-):
-    """Create a person with given or random attributes"""
-
-    person_id = str(uuid.uuid4())
-
-    # Generate or use provided birth year
-    if birth_year is None:
-        birth_year = random.randint(START_YEAR, CURRENT_YEAR - 5)
-
-    # Generate sex/gender
-    sex = forced_gender if forced_gender else random.choice(['M', 'F'])
-
-    # Generate names
-    if not first_name:
-        first_name = names.get_first_name(
-            gender='male' if sex == 'M' else 'female')
-
-    # For last name, use father's if available, otherwise generate
-    if not last_name and father_id and father_id in people:
-        last_name = people[father_id]['last_name']
-    elif not last_name:
-        last_name = names.get_last_name()
-
-    middle_name = names.get_first_name(
-        gender='male' if sex == 'M' else 'female') if random.random() < 0.7 else None
-
-    # Determine maiden name for females
-    maiden_name = None
-    if sex == 'F' and random.random() < 0.8:
-        maiden_name = last_name  # Will be updated if the person marries
-
-    # Create birth date
-    date_of_birth = create_date(birth_year)
-
-    # Determine death information
-    is_deceased, date_of_death, cause_of_death = random_age_death(
-        birth_year, is_deceased)
-
-    # Physical characteristics - with some genetic influence
-    blood_type = random.choices(BLOOD_TYPES, weights=BLOOD_TYPE_DIST)[0]
-
-    # Eye and hair color influenced by parents
-    eye_color = None
-    hair_color = None
-
-    if father_id in people and mother_id in people and random.random() < 0.8:
-        # 80% chance to inherit from parents
-        eye_color = random.choice(
-            [people[father_id]['eye_color'], people[mother_id]['eye_color']])
-        hair_color = random.choice(
-            [people[father_id]['hair_color'], people[mother_id]['hair_color']])
-
-    if not eye_color:
-        eye_color = random.choice(EYE_COLORS)
-    if not hair_color:
-        hair_color = random.choice(HAIR_COLORS)
-
-    # Other attributes
-    height_cm = random.randint(
-        150, 200) if sex == 'M' else random.randint(145, 185)
-
-    # Generate plausible contact info based on birth year (older people less likely to have email)
-    email = None
-    age = CURRENT_YEAR - birth_year
-    if age >= 10 and age <= 90 and random.random() < (0.9 - (age / 100)):
-        email = f"{first_name.lower()}.{last_name.lower()}@{random.choice(['gmail.com', 'yahoo.com', 'outlook.com', 'hotmail.com'])}"
-
-    # Phone more common than email
-    phone = None
-    if age >= 12 and random.random() < (0.95 - (age / 200)):
-        phone = f"+1-{random.randint(200, 999)}-{random.randint(100, 999)}-{random.randint(1000, 9999)}"
-
-    # Cultural background - with some family influence
-    nationality = None
-    ethnicity = None
-    religion = None
-
-    if father_id in people and mother_id in people and random.random() < 0.9:
-        # 90% chance to have same nationality as parents if both known
-        nationality = random.choice(
-            [people[father_id]['nationality'], people[mother_id]['nationality']])
-        ethnicity = random.choice(
-            [people[father_id]['ethnicity'], people[mother_id]['ethnicity']])
-        # 80% chance to follow parents' religion
-        if random.random() < 0.8:
-            religion = random.choice(
-                [people[father_id]['religion'], people[mother_id]['religion']])
-
-    if not nationality:
-        nationality = random.choice(NATIONALITIES)
-    if not ethnicity:
-        ethnicity = random.choice(ETHNICITIES)
-    if not religion:
-        religion = random.choice(RELIGIONS)
-
-    # Location data
-    place_of_birth = fake.city() + ", " + fake.country()
-    address = fake.address() if not is_deceased and age >= 18 else None
-
-    # Education and occupation based on age
-    education = None
-    occupation = None
-
-    if age >= 18:
-        edu_levels = [
-            "High School", "Some College", "Bachelor's Degree",
-            "Master's Degree", "Ph.D.", "Trade School", "None"
+            # Parents always have lower IDs than their children
+            pending = set()
+            stack = list(person_ids)
+            while stack:
+                pid = stack.pop()
+                if pid in people and pid not in pending and not people.has_attributes[pid]:
+                    pending.add(pid)
+                    stack.append(people.father_id[pid])
+                    stack.append(people.mother_id[pid])
+            pending = sorted(pending)
+
+        if self.batch_attributes and pending:
+            if not self.attribute_pool_size:
+                raise ValueError("Batch attributes are drawn from attribute pools, "
+                                 "set attribute_pool_size")
+            try:
+                from family_tree_numpy_engine import fill_attributes_numpy
+            except ImportError as e:
+                raise ImportError(
+                    "Batch attributes require NumPy. Install with: pip install numpy") from e
+            fill_attributes_numpy(self, pending)
+            return
+
+        for pid in pending:
+            attributes = self._draw_attributes(
+                random.Random((self.attribute_seed << 32) | pid), people.sex[pid],
+                people.birth_year[pid], people.is_deceased[pid], people.first_name[pid],
+                people.last_name[pid], people.father_id[pid], people.mother_id[pid])
+            for name, value in attributes.items():
+                getattr(people, name)[pid] = value
+
+    def generation_of(self, birth_year, father_id=None, mother_id=None):
+        """Generation of a new person: one after their parents', else that of their birth cohort"""
+        parent_generations = [self.people.generation[pid]
+                              for pid in (father_id, mother_id) if pid in self.people]
+        if parent_generations:
+            return max(parent_generations) + 1
+        return self.cohort_generation(birth_year)
+
+    def cohort_generation(self, birth_year):
+        """Generation of people born in a given year, counting GENERATION_YEARS per generation"""
+        return 1 + max(birth_year - self.START_YEAR, 0) // self.GENERATION_YEARS
+
+    def can_have_children(self, person_id):
+        """Whether a child of the person stays within the requested number of generations"""
+        return (self.num_generations is None or
+                self.people.generation[person_id] < self.num_generations)
+
+    def index_person(self, person_id):
+        """Add a person to the candidate index and schedule their removal on death"""
+        birth_year = self.people.birth_year[person_id]
+        self.candidate_index[self.people.sex[person_id]].setdefault(birth_year, {})[person_id] = None
+        self.working_set[person_id] = None
+
+        if self.people.is_deceased[person_id]:
+            self.deaths_by_year.setdefault(self.people.death_year[person_id], []).append(person_id)
+
+    def prune_candidate_index(self, year):
+        """Drop everyone who died before the given year from the candidate index and working set
+
+        When evicting, the state no engine reads any more is moved out of
+        memory: the text fields of the dead (if they have their attributes,
+        which lazy attributes only draw after the simulation) go to the
+        archive, as do the marriages that ended, and their entries in
+        children_map and current_marriages are dropped (the parent columns and
+        the marriages hold the same links). Their fixed-width columns stay, so
+        IDs, parent links and inherited traits keep working.
+        """
+        evicted = []
+        for death_year in [y for y in self.deaths_by_year if y < year]:
+            for pid in self.deaths_by_year.pop(death_year):
+                buckets = self.candidate_index[self.people.sex[pid]]
+                birth_year = self.people.birth_year[pid]
+                del buckets[birth_year][pid]
+                if not buckets[birth_year]:
+                    del buckets[birth_year]
+                del self.working_set[pid]
+                if not self.archive:
+                    continue
+                if self.people.has_attributes[pid]:
+                    evicted.append((pid, *self.people.take_text(pid)))
+                    self.people.is_evicted[pid] = True
+                self.children_map.pop(pid, None)
+                self.current_marriages.pop(pid, None)
+        if evicted:
+            self.archive.add(evicted)
+        if self.ended_marriages:
+            self.archive.add_marriages(
+                (index, self.marriages[index]['person1_id'], self.marriages[index]['person2_id'],
+                 self.marriages[index]['year'])
+                for index in self.ended_marriages)
+            for index in self.ended_marriages:
+                self.marriages[index] = None
+            self.ended_marriages = []
+
+    def is_alive(self, person_id, year):
+        """Check if a person is still alive at some point in the given year"""
+        return not (self.people.is_deceased[person_id] and self.people.death_year[person_id] < year)
+
+    def find_living_by_birth_year(self, sex, first_year, last_year, year):
+        """Living people of a sex born between first_year and last_year (inclusive), in creation order"""
+        buckets = self.candidate_index[sex]
+        found = [
+            pid
+            for birth_year in range(first_year, last_year + 1)
+            for pid in buckets.get(birth_year, ())
+            if self.is_alive(pid, year)
         ]
-        education = random.choice(edu_levels)
-
-        if not is_deceased or (is_deceased and age >= 22):
-            occupation = fake.job()
-
-    person = {
-        "id": person_id,
-        "first_name": first_name,
-        "middle_name": middle_name,
-        "last_name": last_name,
-        "maiden_name": maiden_name,
-        "date_of_birth": date_of_birth,
-        "sex": sex,
-        "blood_type": blood_type,
-        "nationality": nationality,
-        "ethnicity": ethnicity,
-        "place_of_birth": place_of_birth,
-        "date_of_death": date_of_death,
-        "is_deceased": is_deceased,
-        "cause_of_death": cause_of_death,
-        "height_cm": height_cm,
-        "eye_color": eye_color,
-        "hair_color": hair_color,
-        "email": email,
-        "phone": phone,
-        "address": address,
-        "occupation": occupation,
-        "education": education,
-        "religion": religion,
-        "notes": None,
-        # 30% have legacy content
-        "legacy_bucket_id": str(uuid.uuid4()) if random.random() < 0.3 else None,
-        "father_id": father_id,
-        "mother_id": mother_id
-    }
-
-    people[person_id] = person
-    return person_id
-
-
-def simulate_marriage(person1_id, person2_id, year):
-    """Register a marriage between two people"""
-    if person1_id not in people or person2_id not in people:
-        return False
-
-    p1 = people[person1_id]
-    p2 = people[person2_id]
-
-    # Make sure they're of age
-    p1_birth_year = int(p1['date_of_birth'].split('-')[0])
-    p2_birth_year = int(p2['date_of_birth'].split('-')[0])
-
-    if (year - p1_birth_year < MARRIAGE_MIN_AGE) or (year - p2_birth_year < MARRIAGE_MIN_AGE):
+        found.sort()
+        return found
+
+    def simulate_marriage(self, person1_id, person2_id, year):
+        """Register a marriage between two people"""
+        if person1_id not in self.people or person2_id not in self.people:
+            return False
+
+        # Make sure they're of age
+        p1_birth_year = self.people.birth_year[person1_id]
+        p2_birth_year = self.people.birth_year[person2_id]
+
+        if (year - p1_birth_year < self.MARRIAGE_MIN_AGE) or (year - p2_birth_year < self.MARRIAGE_MIN_AGE):
+            return False
+
+        # Update maiden name for female spouse
+        if self.people.sex[person1_id] == 'F' and self.people.maiden_name[person1_id] is None:
+            self.people.maiden_name[person1_id] = self.people.last_name[person1_id]
+            self.people.last_name[person1_id] = self.people.last_name[person2_id]
+        elif self.people.sex[person2_id] == 'F' and self.people.maiden_name[person2_id] is None:
+            self.people.maiden_name[person2_id] = self.people.last_name[person2_id]
+            self.people.last_name[person2_id] = self.people.last_name[person1_id]
+
+        # Record the marriage
+        self.register_marriage({
+            'person1_id': person1_id,
+            'person2_id': person2_id,
+            'year': year,
+            'current': True
+        })
+
+        return True
+
+    def register_marriage(self, marriage):
+        """Record a marriage and add it to the registry if it is current"""
+        marriage_index = len(self.marriages)
+        self.marriages.append(marriage)
+        if marriage['current']:
+            self.active_marriages[marriage_index] = marriage
+            self.current_marriages.setdefault(marriage['person1_id'], []).append(marriage_index)
+            self.current_marriages.setdefault(marriage['person2_id'], []).append(marriage_index)
+        return marriage_index
+
+    def end_marriage(self, marriage_index):
+        """Mark a marriage as no longer current and drop it from the registry"""
+        marriage = self.active_marriages.pop(marriage_index)
+        marriage['current'] = False
+        for pid in (marriage['person1_id'], marriage['person2_id']):
+            indexes = self.current_marriages.get(pid)
+            if indexes is None:
+                continue  # Dropped on their death when evicting
+            indexes.remove(marriage_index)
+            if not indexes:
+                del self.current_marriages[pid]
+        if self.archive:
+            self.ended_marriages.append(marriage_index)
+
+    def is_married(self, person_id, year):
+        """Check if a person has a current marriage registered on or before the given year"""
+        return any(self.marriages[i]['year'] <= year for i in self.current_marriages.get(person_id, ()))
+
+    def _skip_random_draws(self, count):
+        """Advance the RNG exactly as `count` calls to random() would"""
+        # random() consumes two 32-bit words, getrandbits() one word per 32 bits
+        if count > 0:
+            self.rng.getrandbits(64 * count)
+
+    def _is_married_with_polygamy(self, person_id, year):
+        """Married check where each marriage may be waived with PROB_POLYGAMY
+
+        Matches a scan over the whole `marriages` list that makes one draw per
+        marriage until a current, non-waived marriage of the person is found, so
+        the random stream is unchanged; draws for other marriages are skipped in bulk.
+        """
+        drawn = 0
+        for index in self.current_marriages.get(person_id, ()):
+            if self.marriages[index]['year'] > year:
+                continue
+            self._skip_random_draws(index - drawn)
+            drawn = index + 1
+            if self.rng.random() >= self.PROB_POLYGAMY:
+                return True
+        self._skip_random_draws(len(self.marriages) - drawn)
         return False
 
-    # Update maiden name for female spouse
-    if p1['sex'] == 'F' and p1['maiden_name'] is None:
-        p1['maiden_name'] = p1['last_name']
-        p1['last_name'] = p2['last_name']
-    elif p2['sex'] == 'F' and p2['maiden_name'] is None:
-        p2['maiden_name'] = p2['last_name']
-        p2['last_name'] = p1['last_name']
-
-    # Record the marriage
-    marriages.append({
-        'person1_id': person1_id,
-        'person2_id': person2_id,
-        'year': year,
-        'current': True
-    })
-
-    return True
-
-
-def find_spouse_candidates(person_id, year):
-    """Find suitable candidates for marriage based on age and availability"""
-    if person_id not in people:
-        return []
-
-    person = people[person_id]
-    birth_year = int(person['date_of_birth'].split('-')[0])
-
-    # Person must be of marriageable age
-    if year - birth_year < MARRIAGE_MIN_AGE:
-        return []
-
-    # Person must be alive
-    if person['is_deceased'] and int(person['date_of_death'].split('-')[0]) < year:
-        return []
-
-    gender_preference = 'F' if person['sex'] == 'M' else 'M'
-
-    # Find candidates of appropriate gender and age
-    candidates = []
-    for pid, p in people.items():
-        if p['sex'] != gender_preference:
-            continue
+    def find_spouse_candidates(self, person_id, year):
+        """Find suitable candidates for marriage based on age and availability"""
+        if person_id not in self.people:
+            return []
+
+        birth_year = self.people.birth_year[person_id]
+
+        # Person must be of marriageable age
+        if year - birth_year < self.MARRIAGE_MIN_AGE:
+            return []
+
+        # Person must be alive
+        if not self.is_alive(person_id, year):
+            return []
+
+        sex = self.people.sex[person_id]
+        gender_preference = 'F' if sex == 'M' else 'M'
+        # Allow polygamy for males in older times
+        allow_polygamy = year < 1970 and sex == 'M'
+
+        max_age_diff = self.max_spouse_age_gap(year)
+
+        # Find living candidates of appropriate gender and age
+        candidates = []
+        for pid in self.find_living_by_birth_year(
+                gender_preference,
+                birth_year - max_age_diff,
+                min(birth_year + max_age_diff, year - self.MARRIAGE_MIN_AGE),
+                year):
+            # Check if already married (and not polygamous)
+            if allow_polygamy:
+                already_married = self._is_married_with_polygamy(pid, year)
+            else:
+                already_married = self.is_married(pid, year)
+
+            if (not already_married and pid not in self.outside_proposals and
+                    not self.is_close_relative(person_id, pid)):
+                candidates.append(pid)
+
+        return candidates
+
+    def looks_outside(self, person_id):
+        """Whether a person's spouse search looks outside the simulation, as a
+        share `outside_share` of searches do (see propose_outside)
+
+        Without an outside, no random draw is made.
+        """
+        return bool(self.outside_share and self.rng.random() < self.outside_share and
+                    self.propose_outside(person_id))
+
+    def propose_outside(self, person_id):
+        """Leave a person's spouse search to the outside of the simulation, if any
+
+        Such searches are collected in outside_proposals for the caller to
+        match (see family_tree_parallel); until then, the person is off the
+        marriage market here. Engines also leave the searches that found no
+        one here, as the outside may have someone.
+        """
+        if not self.outside_share:
+            return False
+        self.outside_proposals[person_id] = None
+        return True
+
+    def max_spouse_age_gap(self, year):
+        """Largest difference in birth years between spouses marrying in `year`,
+        more flexible for older generations"""
+        return 20 if year < 1970 else 15
+
+    def is_close_relative(self, person1_id, person2_id):
+        """Whether two people share an ancestor within RELATIVE_EXCLUSION_GENERATIONS
+
+        Always False while the setting is 0. The kinship engine caches the
+        near ancestors of everyone it is asked about, so repeated checks of
+        the same people are set lookups. Ancestors of people who came from
+        the outside count too (see outside_ancestors).
+        """
+        if not self.RELATIVE_EXCLUSION_GENERATIONS:
+            return False
+        if self._kinship is None:
+            self._kinship = KinshipEngine.from_store(self.people)
+        if not self.outside_ancestors:
+            return self._kinship.share_ancestor(
+                person1_id, person2_id, self.RELATIVE_EXCLUSION_GENERATIONS)
+        return not self._near_ancestors(person1_id).isdisjoint(
+            self._near_ancestors(person2_id))
+
+    def _near_ancestors(self, person_id):
+        """The person and their ancestors up to RELATIVE_EXCLUSION_GENERATIONS
+        back, with those left outside by the people who came from there"""
+        generations = self.RELATIVE_EXCLUSION_GENERATIONS
+        near = set()
+        for ancestor, depth in self._kinship.ancestor_depths(person_id).items():
+            if depth <= generations:
+                near.add(ancestor)
+                near.update(outside for outside, up in
+                            self.outside_ancestors.get(ancestor, {}).items()
+                            if depth + up <= generations)
+        return near
+
+    def simulate_child(self, father_id, mother_id, year):
+        """Create a child with the given parents in the given year"""
+        if mother_id not in self.people:
+            return None
 
-        p_birth_year = int(p['date_of_birth'].split('-')[0])
+        # The child may not go beyond the requested number of generations
+        if not self.can_have_children(mother_id) or (
+                father_id in self.people and not self.can_have_children(father_id)):
+            return None
 
-        # Skip if too young
-        if year - p_birth_year < MARRIAGE_MIN_AGE:
-            continue
+        # Calculate mother's age
+        mother_age = year - self.people.birth_year[mother_id]
 
-        # Skip if deceased
-        if p['is_deceased'] and int(p['date_of_death'].split('-')[0]) < year:
-            continue
+        # Check if mother is of reproductive age
+        if mother_age < self.FERTILITY_START_AGE or mother_age > self.FERTILITY_END_AGE_FEMALE:
+            return None
 
-        # Age difference check (more flexible for older generations)
-        age_diff = abs(birth_year - p_birth_year)
-        if year < 1970 and age_diff > 20:
-            continue
-        elif year >= 1970 and age_diff > 15:
-            continue
+        # Check if mother is alive
+        if not self.is_alive(mother_id, year):
+            return None
 
-        # Check if already married (and not polygamous)
-        already_married = False
-        for marriage in marriages:
-            if year < 1970 and person['sex'] == 'M' and random.random() < PROB_POLYGAMY:
-                # Allow polygamy for males in older times
+        # Check if father is of reproductive age and alive (if known)
+        if father_id in self.people:
+            father_age = year - self.people.birth_year[father_id]
+
+            if father_age < self.FERTILITY_START_AGE or father_age > self.FERTILITY_END_AGE_MALE:
+                return None
+
+            if not self.is_alive(father_id, year):
+                return None
+
+        # Create the child with randomized gender
+        child_id = self.create_person(
+            birth_year=year,
+            father_id=father_id,
+            mother_id=mother_id,
+            last_name=self.people.last_name[father_id] if father_id in self.people else self.people.last_name[mother_id]
+        )
+
+        # Register child with parents
+        if father_id is not None:
+            if father_id not in self.children_map:
+                self.children_map[father_id] = []
+            self.children_map[father_id].append(child_id)
+
+        if mother_id not in self.children_map:
+            self.children_map[mother_id] = []
+        self.children_map[mother_id].append(child_id)
+
+        return child_id
+
+    def create_unknown_parent(self, is_male, birth_year=None, generation=None):
+        """Create a placeholder for an unknown parent
+
+        An unknown father of a child takes the mother's `generation`.
+        """
+        if birth_year is None:
+            # Estimate a plausible birth year
+            birth_year = self.rng.randint(self.START_YEAR, self.CURRENT_YEAR - 20)
+
+        parent_id = self.create_person(
+            birth_year=birth_year,
+            forced_gender='M' if is_male else 'F',
+            is_deceased=self.rng.random() < 0.8,  # Likely deceased if unknown
+            first_name="Unknown",
+            last_name="Unknown" if is_male else "Unknown",
+            generation=generation
+        )
+
+        # Mark as unknown in notes
+        self.people.notes[parent_id] = "Placeholder for unknown parent"
+
+        return parent_id
+
+    def build_initial_population(self, num_families=15, family_max_size=20,
+                                 first_birth_year=None):
+        """Create initial population with several distinct family lines"""
+        if first_birth_year is None:
+            first_birth_year = self.START_YEAR
+
+        family_patriarchs = []
+        for _ in range(num_families):
+            # Create a patriarch for each family line (born in early 1900s)
+            birth_year = self.rng.randint(first_birth_year, first_birth_year + 30)
+            patriarch_id = self.create_person(
+                birth_year=birth_year, forced_gender='M', generation=1)
+            family_patriarchs.append(patriarch_id)
+
+            # Create a spouse for the patriarch
+            birth_year_spouse = self.rng.randint(birth_year - 5, birth_year + 5)
+            spouse_id = self.create_person(
+                birth_year=birth_year_spouse, forced_gender='F', generation=1)
+
+            # Register marriage at appropriate year
+            marriage_year = max(birth_year, birth_year_spouse) + \
+                self.rng.randint(18, 25)
+            self.simulate_marriage(patriarch_id, spouse_id, marriage_year)
+
+            # Generate children
+            # Larger families in older generations
+            num_children = self.rng.randint(2, 8)
+            # Couples who marry too late for a grown child before the end (as
+            # in short incremental runs) have theirs during the simulation
+            last_birth_year = min(marriage_year + 20, self.CURRENT_YEAR - 20)
+            if last_birth_year <= marriage_year:
                 continue
-
-            if ((marriage['person1_id'] == pid or marriage['person2_id'] == pid) and
-                    marriage['current'] and marriage['year'] <= year):
-                already_married = True
+            for _ in range(num_children):
+                child_birth_year = self.rng.randint(marriage_year + 1, last_birth_year)
+                self.simulate_child(patriarch_id, spouse_id, child_birth_year)
+
+        return family_patriarchs
+
+    def simulated_years(self, until=None):
+        """Years for an engine's yearly loop to run through
+
+        A run starts where the last one paused (see resume_year), or else 20
+        years after START_YEAR. With `until`, it pauses before that year:
+        resume_year is set to it, unless the loop stops early (a break skips
+        the loop's else clause), which ends the simulation.
+        """
+        first_year = self.START_YEAR + 20
+        if self.resume_year is not None:
+            first_year, self.resume_year = self.resume_year, None
+        return range(first_year, min(until or self.CURRENT_YEAR, self.CURRENT_YEAR))
+
+    def pause(self, until):
+        """Let the next run continue from `until`, if that is before the end"""
+        if until is not None and until < self.CURRENT_YEAR:
+            self.resume_year = until
+
+    def simulate_generations(self, num_generations=3, until=None):
+        """Simulate multiple generations with relationships, marriages, etc.
+
+        No child is born beyond generation `num_generations` (None for no
+        limit), and the simulation stops early once no woman who can still
+        have a child within it is left, or once the target population is reached.
+        With `until`, the simulation pauses before that year and the next call
+        continues from there.
+        """
+        self.num_generations = num_generations
+
+        for current_year in self.simulated_years(until):
+            if self.target_population and len(self.people) >= self.target_population:
+                print(f"Reached the target population of {self.target_population} "
+                      f"in {current_year}")
                 break
 
-        if not already_married:
-            candidates.append(pid)
+            if self.profiler:
+                self.profiler.start_year(current_year, len(self.people))
 
-    return candidates
+            if (self.checkpoint_path and self.checkpoint_interval and
+                    (current_year - self.START_YEAR) % self.checkpoint_interval == 0):
+                with self.phase('checkpoint'):
+                    self.save_checkpoint(self.checkpoint_path, current_year)
 
+            # Find eligible people for events in this year
+            with self.phase('eligibility', len(self.people)):
+                self.prune_candidate_index(current_year)
 
-def simulate_child(father_id, mother_id, year):
-    """Create a child with the given parents in the given year"""
-    if mother_id not in people:
-        return None
+                eligible_for_marriage = []
+                eligible_for_childbirth = []
+                lineage_open = False  # Whether a child can still be born within the generations
 
-    mother = people[mother_id]
+                for pid in self.working_set:
+                    # Skip if person is deceased before this year
+                    if not self.is_alive(pid, current_year):
+                        continue
 
-    # Calculate mother's age
-    mother_birth_year = int(mother['date_of_birth'].split('-')[0])
-    mother_age = year - mother_birth_year
+                    age = current_year - self.people.birth_year[pid]
+                    sex = self.people.sex[pid]
 
-    # Check if mother is of reproductive age
-    if mother_age < FERTILITY_START_AGE or mother_age > FERTILITY_END_AGE_FEMALE:
-        return None
+                    # Eligible for marriage (unless waiting for a search outside)
+                    if (age >= self.MARRIAGE_MIN_AGE and not self.is_married(pid, current_year)
+                            and pid not in self.outside_proposals):
+                        eligible_for_marriage.append(pid)
 
-    # Check if mother is alive
-    if mother['is_deceased'] and int(mother['date_of_death'].split('-')[0]) < year:
-        return None
+                    if not self.can_have_children(pid):
+                        continue
+                    if sex == 'F' and age <= self.FERTILITY_END_AGE_FEMALE:
+                        lineage_open = True
 
-    # Check if father is of reproductive age and alive (if known)
-    if father_id and father_id in people:
-        father = people[father_id]
-        father_birth_year = int(father['date_of_birth'].split('-')[0])
-        father_age = year - father_birth_year
+                    # Eligible for having children
+                    if ((sex == 'F' and self.FERTILITY_START_AGE <= age <= self.FERTILITY_END_AGE_FEMALE) or
+                            (sex == 'M' and self.FERTILITY_START_AGE <= age <= self.FERTILITY_END_AGE_MALE)):
+                        eligible_for_childbirth.append(pid)
 
-        if father_age < FERTILITY_START_AGE or father_age > FERTILITY_END_AGE_MALE:
-            return None
+            if self.num_generations is not None and not lineage_open:
+                print(f"No one left to have children within {self.num_generations} "
+                      f"generations in {current_year}, stopping")
+                break
 
-        if father['is_deceased'] and int(father['date_of_death'].split('-')[0]) < year:
+            # Set for the membership checks below, the list keeps the iteration order
+            fertile = set(eligible_for_childbirth)
+
+            # Process marriages
+            with self.phase('marriages', len(eligible_for_marriage)):
+                for pid in eligible_for_marriage:
+                    # Not everyone gets married in a given year
+                    if self.rng.random() < 0.1 and not self.looks_outside(pid):
+                        candidates = self.find_spouse_candidates(pid, current_year)
+                        if candidates:
+                            spouse_id = self.rng.choice(candidates)
+                            self.simulate_marriage(pid, spouse_id, current_year)
+                        else:
+                            self.propose_outside(pid)
+
+            # Process divorces
+            with self.phase('divorces', len(self.active_marriages)):
+                for marriage_index, marriage in list(self.active_marriages.items()):
+                    if marriage['year'] < current_year:
+                        if self.rng.random() < self.PROB_DIVORCE / 50:  # Yearly probability
+                            self.end_marriage(marriage_index)
+
+            # Process childbirths
+            # First for married couples
+            with self.phase('married_births', len(self.active_marriages)):
+                for marriage in self.active_marriages.values():
+                    if marriage['year'] < current_year:
+                        p1_id = marriage['person1_id']
+                        p2_id = marriage['person2_id']
+
+                        # Determine which is male/female
+                        father_id = p1_id if self.people.sex[p1_id] == 'M' else p2_id
+                        mother_id = p1_id if self.people.sex[p1_id] == 'F' else p2_id
+
+                        # 20% chance of having a child in a given year if conditions are right
+                        if (mother_id in fertile and
+                                (not self.children_map.get(mother_id) or len(self.children_map.get(mother_id, [])) < 10)):
+
+                            if self.rng.random() < 0.2:
+                                self.simulate_child(father_id, mother_id, current_year)
+
+            # Then for out-of-wedlock births
+            with self.phase('out_of_wedlock_births', len(eligible_for_childbirth)):
+                father_candidates = None  # Looked up on first use, then kept for the year
+                for mother_id in eligible_for_childbirth:
+                    if self.people.sex[mother_id] == 'F' and self.rng.random() < self.PROB_OUT_OF_WEDLOCK / 10:
+                        # Decide if father is known or unknown
+                        if self.rng.random() < self.PROB_UNKNOWN_FATHER:
+                            # Create unknown father with estimated birth year
+                            mother_birth_year = self.people.birth_year[mother_id]
+                            father_birth_year = mother_birth_year + \
+                                self.rng.randint(-5, 5)
+                            father_id = self.create_unknown_parent(
+                                is_male=True, birth_year=father_birth_year,
+                                generation=self.people.generation[mother_id])
+                            if father_candidates is not None:
+                                self._add_father_candidate(
+                                    father_candidates, father_id, current_year)
+                        else:
+                            # Find random male father
+                            if father_candidates is None:
+                                father_candidates = [
+                                    pid for pid in self.find_living_by_birth_year(
+                                        'M',
+                                        current_year - self.FERTILITY_END_AGE_MALE,
+                                        current_year - self.FERTILITY_START_AGE,
+                                        current_year)
+                                    if self.can_have_children(pid)
+                                ]
+
+                            if father_candidates:
+                                father_id = self.rng.choice(father_candidates)
+                            else:
+                                # Create unknown father
+                                mother_birth_year = self.people.birth_year[mother_id]
+                                father_birth_year = mother_birth_year + \
+                                    self.rng.randint(-5, 5)
+                                father_id = self.create_unknown_parent(
+                                    is_male=True, birth_year=father_birth_year,
+                                    generation=self.people.generation[mother_id])
+                                self._add_father_candidate(
+                                    father_candidates, father_id, current_year)
+
+                        self.simulate_child(father_id, mother_id, current_year)
+
+            # Create orphans and children with unknown parents
+            with self.phase('orphans'):
+                # 5% chance each year to add an orphan, split between the shards of a parallel run
+                if self.rng.random() < 0.05 * (1 - self.outside_share):
+                    self.create_orphan(current_year)
+        else:
+            self.pause(until)
+        if self.resume_year is not None:
+            return
+
+        if self.profiler:
+            self.profiler.stop()
+        if self.checkpoint_path and self.checkpoint_interval:
+            # Final snapshot, resuming from it only needs the export
+            self.save_checkpoint(self.checkpoint_path, self.CURRENT_YEAR)
+
+    def save_checkpoint(self, path, year):
+        """Write a snapshot of the simulation state as of the start of `year`"""
+        state = {
+            'year': year,
+            'settings': {name: value for name, value in vars(self).items() if name.isupper()},
+            'seeded': self.rng is not random,
+            'attribute_pool_size': self.attribute_pool_size,
+            'attribute_seed': self.attribute_seed,
+            'lazy_attributes': self.lazy_attributes,
+            'batch_attributes': self.batch_attributes,
+            'checkpoint_interval': self.checkpoint_interval,
+            'num_generations': self.num_generations,
+            'target_population': self.target_population,
+            'id_scheme': self.id_scheme,
+            'evict_path': self.evict_path,
+            'rng_state': self.rng.getstate(),
+            'fake_rng_state': self.fake.random.getstate(),
+            'people': self.people,
+            'marriages': self.marriages,
+            'ended_marriages': self.ended_marriages,
+            'children_map': self.children_map,
+            'current_marriages': self.current_marriages,
+            'active_marriages': self.active_marriages,
+            'candidate_index': self.candidate_index,
+            'deaths_by_year': self.deaths_by_year,
+            'working_set': self.working_set,
+            'loaded_ids': self.loaded_ids,
+            'loaded_legacy_bucket_ids': self.loaded_legacy_bucket_ids,
+        }
+        # Write next to the previous snapshot and swap, so a crash never leaves a partial file
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """Recreate a simulation from a snapshot; simulate_generations continues from it
+
+        Snapshots of simulations without a seed restore the global `random`
+        and shared Faker state, as those are what such simulations draw from.
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+
+        sim = cls(seed=0 if state['seeded'] else None,
+                  attribute_pool_size=state['attribute_pool_size'],
+                  attribute_seed=state['attribute_seed'],
+                  lazy_attributes=state['lazy_attributes'],
+                  batch_attributes=state['batch_attributes'],
+                  checkpoint_path=path,
+                  checkpoint_interval=state['checkpoint_interval'],
+                  id_scheme=state['id_scheme'],
+                  **state['settings'])
+        if state['evict_path']:
+            # People evicted after the snapshot are simply archived again
+            sim.evict_path = state['evict_path']
+            sim.archive = PersonArchive(state['evict_path'], reset=False)
+        sim.rng.setstate(state['rng_state'])
+        sim.fake.random.setstate(state['fake_rng_state'])
+        for name in ('num_generations', 'target_population', 'people', 'marriages',
+                     'ended_marriages', 'children_map', 'current_marriages',
+                     'active_marriages', 'candidate_index', 'deaths_by_year',
+                     'working_set', 'loaded_ids', 'loaded_legacy_bucket_ids'):
+            setattr(sim, name, state[name])
+        sim.resume_year = state['year']
+        return sim
+
+    def create_orphan(self, birth_year):
+        """Create a child born in the given year to newly created or unknown parents"""
+        # Decide if parents are known
+        has_known_father = self.rng.random() > self.PROB_UNKNOWN_FATHER
+        has_known_mother = self.rng.random() > self.PROB_UNKNOWN_MOTHER
+
+        father_id = None
+        mother_id = None
+
+        # Parents of the cohort of the last generation would have a child beyond it
+        def beyond_generations(parent_birth_year):
+            return (self.num_generations is not None and
+                    self.cohort_generation(parent_birth_year) >= self.num_generations)
+
+        father_birth_year = birth_year - self.rng.randint(20, 40)
+        if beyond_generations(father_birth_year):
             return None
+        if has_known_father:
+            # Find or create father
+            father_id = self.create_person(
+                birth_year=father_birth_year, forced_gender='M')
+        else:
+            father_id = self.create_unknown_parent(
+                is_male=True, birth_year=father_birth_year)
 
-    # Create the child with randomized gender
-    child_id = create_person(
-        birth_year=year,
-        father_id=father_id,
-        mother_id=mother_id,
-        last_name=people[father_id]['last_name'] if father_id and father_id in people else mother['last_name']
-    )
-
-    # Register child with parents
-    if father_id:
-        if father_id not in children_map:
-            children_map[father_id] = []
-        children_map[father_id].append(child_id)
-
-    if mother_id not in children_map:
-        children_map[mother_id] = []
-    children_map[mother_id].append(child_id)
-
-    return child_id
-
-
-def create_unknown_parent(is_male, birth_year=None):
-    """Create a placeholder for an unknown parent"""
-    if birth_year is None:
-        # Estimate a plausible birth year
-        birth_year = random.randint(START_YEAR, CURRENT_YEAR - 20)
-
-    parent_id = create_person(
-        birth_year=birth_year,
-        forced_gender='M' if is_male else 'F',
-        is_deceased=random.random() < 0.8,  # Likely deceased if unknown
-        first_name="Unknown",
-        last_name="Unknown" if is_male else "Unknown"
-    )
-
-    # Mark as unknown in notes
-    people[parent_id]['notes'] = "Placeholder for unknown parent"
-
-    return parent_id
-
-
-def build_initial_population(num_families=15, family_max_size=20):
-    """Create initial population with several distinct family lines"""
-
-    family_patriarchs = []
-    for _ in range(num_families):
-        # Create a patriarch for each family line (born in early 1900s)
-        birth_year = random.randint(START_YEAR, START_YEAR + 30)
-        patriarch_id = create_person(birth_year=birth_year, forced_gender='M')
-        family_patriarchs.append(patriarch_id)
-
-        # Create a spouse for the patriarch
-        birth_year_spouse = random.randint(birth_year - 5, birth_year + 5)
-        spouse_id = create_person(
-            birth_year=birth_year_spouse, forced_gender='F')
-
-        # Register marriage at appropriate year
-        marriage_year = max(birth_year, birth_year_spouse) + \
-            random.randint(18, 25)
-        simulate_marriage(patriarch_id, spouse_id, marriage_year)
-
-        # Generate children
-        # Larger families in older generations
-        num_children = random.randint(2, 8)
-        for _ in range(num_children):
-            child_birth_year = random.randint(
-                marriage_year + 1, min(marriage_year + 20, CURRENT_YEAR - 20))
-            simulate_child(patriarch_id, spouse_id, child_birth_year)
-
-    return family_patriarchs
-
-
-def simulate_generations(num_generations=3):
-    """Simulate multiple generations with relationships, marriages, etc."""
-
-    for current_year in range(START_YEAR + 20, CURRENT_YEAR):
-        # Find eligible people for events in this year
-        eligible_for_marriage = []
-        eligible_for_childbirth = []
-
-        for pid, person in people.items():
-            birth_year = int(person['date_of_birth'].split('-')[0])
-
-            # Skip if person is deceased before this year
-            if person['is_deceased'] and int(person['date_of_death'].split('-')[0]) < current_year:
-                continue
-
-            age = current_year - birth_year
-
-            # Eligible for marriage
-            if age >= MARRIAGE_MIN_AGE:
-                # Check if already married
-                already_married = False
-                for marriage in marriages:
-                    if ((marriage['person1_id'] == pid or marriage['person2_id'] == pid) and
-                            marriage['current'] and marriage['year'] <= current_year):
-                        already_married = True
-                        break
-
-                if not already_married:
-                    eligible_for_marriage.append(pid)
-
-            # Eligible for having children
-            if ((person['sex'] == 'F' and FERTILITY_START_AGE <= age <= FERTILITY_END_AGE_FEMALE) or
-                    (person['sex'] == 'M' and FERTILITY_START_AGE <= age <= FERTILITY_END_AGE_MALE)):
-                eligible_for_childbirth.append(pid)
-
-        # Process marriages
-        for pid in eligible_for_marriage.copy():
-            if random.random() < 0.1:  # Not everyone gets married in a given year
-                candidates = find_spouse_candidates(pid, current_year)
-                if candidates:
-                    spouse_id = random.choice(candidates)
-                    if simulate_marriage(pid, spouse_id, current_year):
-                        # This is where the error occurs - need to check if still in list
-                        if pid in eligible_for_marriage:  # Add this check
-                            eligible_for_marriage.remove(pid)
-                        if spouse_id in eligible_for_marriage:
-                            eligible_for_marriage.remove(spouse_id)
-
-        # Process divorces
-        for marriage in marriages:
-            if marriage['current'] and marriage['year'] < current_year:
-                if random.random() < PROB_DIVORCE / 50:  # Yearly probability
-                    marriage['current'] = False
-
-        # Process childbirths
-        # First for married couples
-        for marriage in marriages:
-            if marriage['current'] and marriage['year'] < current_year:
-                p1_id = marriage['person1_id']
-                p2_id = marriage['person2_id']
-
-                # Determine which is male/female
-                father_id = p1_id if people[p1_id]['sex'] == 'M' else p2_id
-                mother_id = p1_id if people[p1_id]['sex'] == 'F' else p2_id
-
-                # 20% chance of having a child in a given year if conditions are right
-                if (mother_id in eligible_for_childbirth and
-                        (not children_map.get(mother_id) or len(children_map.get(mother_id, [])) < 10)):
-
-                    if random.random() < 0.2:
-                        simulate_child(father_id, mother_id, current_year)
-
-        # Then for out-of-wedlock births
-        for mother_id in eligible_for_childbirth:
-            if people[mother_id]['sex'] == 'F' and random.random() < PROB_OUT_OF_WEDLOCK / 10:
-                # Decide if father is known or unknown
-                if random.random() < PROB_UNKNOWN_FATHER:
-                    # Create unknown father with estimated birth year
-                    mother_birth_year = int(
-                        people[mother_id]['date_of_birth'].split('-')[0])
-                    father_birth_year = mother_birth_year + \
-                        random.randint(-5, 5)
-                    father_id = create_unknown_parent(
-                        is_male=True, birth_year=father_birth_year)
-                else:
-                    # Find random male father
-                    father_candidates = [
-                        pid for pid, p in people.items()
-                        if p['sex'] == 'M' and
-                        FERTILITY_START_AGE <= (current_year - int(p['date_of_birth'].split('-')[0])) <= FERTILITY_END_AGE_MALE and
-                        not (p['is_deceased'] and int(
-                            p['date_of_death'].split('-')[0]) < current_year)
-                    ]
-
-                    if father_candidates:
-                        father_id = random.choice(father_candidates)
-                    else:
-                        # Create unknown father
-                        mother_birth_year = int(
-                            people[mother_id]['date_of_birth'].split('-')[0])
-                        father_birth_year = mother_birth_year + \
-                            random.randint(-5, 5)
-                        father_id = create_unknown_parent(
-                            is_male=True, birth_year=father_birth_year)
-
-                simulate_child(father_id, mother_id, current_year)
-
-        # Create orphans and children with unknown parents
-        if random.random() < 0.05:  # 5% chance each year to add an orphan
-            # Create child
-            birth_year = current_year
-
-            # Decide if parents are known
-            has_known_father = random.random() > PROB_UNKNOWN_FATHER
-            has_known_mother = random.random() > PROB_UNKNOWN_MOTHER
-
-            father_id = None
-            mother_id = None
-
-            if has_known_father:
-                # Find or create father
-                father_birth_year = birth_year - random.randint(20, 40)
-                father_id = create_person(
-                    birth_year=father_birth_year, forced_gender='M')
-            else:
-                father_id = create_unknown_parent(
-                    is_male=True, birth_year=birth_year - random.randint(20, 40))
-
-            if has_known_mother:
-                # Find or create mother
-                mother_birth_year = birth_year - random.randint(18, 35)
-                mother_id = create_person(
-                    birth_year=mother_birth_year, forced_gender='F')
+        mother_birth_year = birth_year - self.rng.randint(18, 35)
+        if beyond_generations(mother_birth_year):
+            return None
+        if has_known_mother:
+            # Find or create mother
+            mother_id = self.create_person(
+                birth_year=mother_birth_year, forced_gender='F')
+        else:
+            mother_id = self.create_unknown_parent(
+                is_male=False, birth_year=mother_birth_year)
+
+        # Create the child
+        self.create_person(birth_year=birth_year,
+                           father_id=father_id, mother_id=mother_id)
+
+    def _add_father_candidate(self, father_candidates, father_id, year):
+        """Keep a year's father candidate list in sync with a newly created man"""
+        age = year - self.people.birth_year[father_id]
+        if (self.FERTILITY_START_AGE <= age <= self.FERTILITY_END_AGE_MALE and
+                self.is_alive(father_id, year) and self.can_have_children(father_id)):
+            father_candidates.append(father_id)
+
+    def _id_factory(self, loaded_ids):
+        """IdFactory for new IDs, with integers continuing after the loaded ones"""
+        start = 1 + max((value for value in loaded_ids if isinstance(value, int)), default=0)
+        return IdFactory(self.id_scheme, start)
+
+    def export_ids(self):
+        """Exported IDs of everyone, indexed by person ID"""
+        new_ids = self._id_factory(self.loaded_ids).new_ids(len(self.people) - len(self.loaded_ids))
+        return self.loaded_ids + new_ids
+
+    def iter_people(self, ids, person_ids=None):
+        """Exported person records with ISO dates, built one at a time"""
+        if person_ids is None:
+            person_ids = range(len(self.people))
+        self.fill_attributes()
+        num_loaded = len(self.loaded_ids)
+        bucket_ids = self._id_factory(self.loaded_legacy_bucket_ids)
+        for pid in person_ids:
+            if pid < num_loaded:
+                legacy_bucket_id = self.loaded_legacy_bucket_ids[pid]
+            elif self.people.has_legacy_bucket[pid]:
+                legacy_bucket_id = bucket_ids.new_id()
             else:
-                mother_id = create_unknown_parent(
-                    is_male=False, birth_year=birth_year - random.randint(18, 35))
-
-            # Create the child
-            create_person(birth_year=birth_year,
-                          father_id=father_id, mother_id=mother_id)
+                legacy_bucket_id = None
+            record = self.people.to_dict(pid, ids, legacy_bucket_id=legacy_bucket_id)
+            if self.people.is_evicted[pid]:
+                record.update(self.archive.get(pid))
+            yield record
+
+    def iter_marriages(self, ids, marriage_indexes=None):
+        """Exported marriage records, referring to people by exported ID"""
+        if marriage_indexes is None:
+            marriage_indexes = range(len(self.marriages))
+        for index in marriage_indexes:
+            marriage = self.marriages[index] or self.archive.get_marriage(index)
+            yield {
+                "person1_id": ids[marriage['person1_id']],
+                "person2_id": ids[marriage['person2_id']],
+                "year": marriage['year'],
+                "current": marriage['current']
+            }
+
+    def load_records(self, people, marriages=()):
+        """Add people and marriages from exported records (e.g. a generated tree)
+
+        Loaded people keep their IDs on export. Parents and spouses are
+        linked by exported ID; parents missing from the records are dropped.
+        """
+        loaded = {}
+        parents = []
+        for record in people:
+            fields = dict(record, father_id=None, mother_id=None, has_attributes=True,
+                          has_legacy_bucket=record['legacy_bucket_id'] is not None)
+            fields['birth_year'], fields['birth_month'], fields['birth_day'] = \
+                parse_date(record['date_of_birth'])
+            fields['death_year'], fields['death_month'], fields['death_day'] = \
+                parse_date(record['date_of_death'])
+            pid = self.people.add(**fields)
+            self.index_person(pid)
+            loaded[record['id']] = pid
+            self.loaded_ids.append(record['id'])
+            self.loaded_legacy_bucket_ids.append(record['legacy_bucket_id'])
+            parents.append((record['father_id'], record['mother_id']))
+
+        # Parent links may point forward in the records, so they are set afterwards
+        offset = len(self.people) - len(parents)
+        for pid, (father_id, mother_id) in enumerate(parents, offset):
+            for parent_id, column in ((father_id, self.people.father_id),
+                                      (mother_id, self.people.mother_id)):
+                if parent_id in loaded:
+                    column[pid] = loaded[parent_id]
+                    self.children_map.setdefault(loaded[parent_id], []).append(pid)
+
+        # Generations follow the parent links, so parents are set before their children
+        generation = self.people.generation
+        for pid in range(offset, len(self.people)):
+            stack = [pid]
+            while stack:
+                child_id = stack[-1]
+                parents = [parent_id for parent_id in (self.people.father_id[child_id],
+                                                       self.people.mother_id[child_id])
+                           if parent_id != NO_PERSON and not generation[parent_id]]
+                if parents:
+                    stack.extend(parents)
+                    continue
+                stack.pop()
+                if not generation[child_id]:
+                    generation[child_id] = self.generation_of(
+                        self.people.birth_year[child_id], self.people.father_id[child_id],
+                        self.people.mother_id[child_id])
 
+        for marriage in marriages:
+            if marriage['person1_id'] in loaded and marriage['person2_id'] in loaded:
+                self.register_marriage({
+                    'person1_id': loaded[marriage['person1_id']],
+                    'person2_id': loaded[marriage['person2_id']],
+                    'year': marriage['year'],
+                    'current': marriage['current']
+                })
+        return loaded
+
+    def export_people(self):
+        """Build exported person records, assigning UUIDs and ISO dates"""
+        return list(self.iter_people(self.export_ids()))
+
+    def run_simulation(self, num_generations=4, engine='classic', until=None):
+        """Run the yearly simulation with the selected engine
+
+        With `until`, the simulation pauses before that year; resume_year is
+        then set and another call continues from it.
+        """
+        if engine == 'classic':
+            self.simulate_generations(num_generations, until)
+        elif engine == 'numpy':
+            try:
+                from family_tree_numpy_engine import simulate_generations_numpy
+            except ImportError as e:
+                raise ImportError(
+                    "The numpy engine requires NumPy. Install with: pip install numpy") from e
+            simulate_generations_numpy(self, num_generations, until)
+        elif engine == 'events':
+            from family_tree_event_engine import simulate_generations_events
+            simulate_generations_events(self, num_generations, until)
+        else:
+            raise ValueError(
+                f"Unknown simulation engine '{engine}', expected one of {ENGINES}")
+
+
+# The module-level API runs on a default simulation driven by the global RNG
+default_simulation = FamilySimulation()
+
+people = default_simulation.people
+marriages = default_simulation.marriages
+children_map = default_simulation.children_map
+current_marriages = default_simulation.current_marriages
+active_marriages = default_simulation.active_marriages
+
+create_date = default_simulation.create_date
+random_age_death = default_simulation.random_age_death
+create_person = default_simulation.create_person
+is_alive = default_simulation.is_alive
+find_living_by_birth_year = default_simulation.find_living_by_birth_year
+simulate_marriage = default_simulation.simulate_marriage
+is_married = default_simulation.is_married
+find_spouse_candidates = default_simulation.find_spouse_candidates
+simulate_child = default_simulation.simulate_child
+create_unknown_parent = default_simulation.create_unknown_parent
+create_orphan = default_simulation.create_orphan
+build_initial_population = default_simulation.build_initial_population
+simulate_generations = default_simulation.simulate_generations
+run_simulation = default_simulation.run_simulation
+export_people = default_simulation.export_people
+
+
+def create_family_tree(output_file='family_tree.json', num_families=15, num_generations=4,
+                       engine='classic', workers=1, simulation=None, attribute_pool_size=None,
+                       attribute_seed=None, lazy_attributes=False, batch_attributes=False,
+                       compact=None, checkpoint_path=None, checkpoint_interval=10,
+                       target_population=None, id_scheme='uuid4', profile_path=None,
+                       evict_path=None):
+    """Generate a complete family tree dataset
+
+    Each call runs a fresh FamilySimulation unless one is passed in; one
+    loaded with FamilySimulation.load_checkpoint continues where it stopped,
+    with the generations and target population it was started with. The
+    output is streamed as JSON, or NDJSON for .ndjson/.jsonl files, gzip or
+    zstd compressed for .gz/.zst files; see family_tree_writer. No child is
+    born beyond generation `num_generations`, and the yearly simulation stops
+    early once no one can have children within it or once the population
+    reaches `target_population`. IDs are assigned according to `id_scheme`
+    (uuid4, uuid7 or integer). With `profile_path`, a JSON timeline of the
+    time spent in each phase of every simulated year is saved there (classic
+    engine). With `evict_path`, the text fields of people who died and the
+    marriages that ended are moved to an archive file there, and the links
+    only kept for the living are dropped (see prune_candidate_index). About 70
+    bytes of fixed-width columns per person stay in memory for everyone.
+    """
+    parallel = workers > 1 and (simulation is None or simulation.resume_year is None)
+    # With workers, the shards build their own attribute pools (see family_tree_parallel)
+    pool_size = attribute_pool_size if simulation is None else simulation.attribute_pool_size
+    sim = simulation or FamilySimulation(attribute_pool_size=None if parallel else pool_size,
+                                         attribute_seed=attribute_seed,
+                                         lazy_attributes=lazy_attributes,
+                                         batch_attributes=batch_attributes,
+                                         checkpoint_path=checkpoint_path,
+                                         checkpoint_interval=checkpoint_interval,
+                                         id_scheme=id_scheme,
+                                         evict_path=evict_path)
+    seed_note = (f"shard seeds drawn from seed {sim.attribute_seed}" if parallel
+                 else f"seed {sim.attribute_seed}")
+    if pool_size:
+        print(f"Attribute pools: {pool_size} values each, {seed_note}")
+    if sim.lazy_attributes:
+        batches = " in NumPy batches" if sim.batch_attributes else ""
+        print(f"Attributes are filled after the simulation{batches}, {seed_note}")
+        if sim.archive:
+            print("Warning: no text fields are evicted with lazy attributes, people have "
+                  "none until the attributes are filled after the simulation")
+    if sim.resume_year is None:
+        # A resumed simulation keeps the limits it was started with
+        sim.num_generations = num_generations
+        if target_population:
+            sim.target_population = target_population
+    if profile_path:
+        sim.enable_profiling()
+    if sim.resume_year is not None:
+        print(f"Resuming the simulation from {sim.resume_year} with {len(sim.people)} people")
+        sim.simulate_generations(sim.num_generations)
+    elif parallel:
+        from family_tree_parallel import build_population_parallel
+        build_population_parallel(sim, num_families, num_generations, engine, workers,
+                                  pool_size)
+    else:
+        sim.build_initial_population(num_families)
+        sim.run_simulation(num_generations, engine)
 
-def create_family_tree(output_file='family_tree.json', num_families=15, num_generations=4):
-    """Generate a complete family tree dataset"""
-    build_initial_population(num_families)
-    simulate_generations(num_generations)
-
-    # Output the family tree data as JSON
-    output = {
-        "people": list(people.values())
-    }
+    # Output the family tree data
+    ids = sim.export_ids()
+    write_family_tree(output_file, sim.iter_people(ids), sim.iter_marriages(ids),
+                      len(sim.people), compact=compact)
 
-    with open(output_file, 'w') as f:
-        json.dump(output, f, indent=2)
+    print(f"Generated family tree with {len(sim.people)} people")
 
-    print(f"Generated family tree with {len(people)} people")
+    if profile_path:
+        sim.profiler.save(profile_path)
+        totals = ', '.join(f"{name} {seconds:.2f}s"
+                           for name, seconds in sim.profiler.totals().items())
+        print(f"Profile saved to {profile_path}: {totals}")
 
     # Generate some statistics
-    num_males = sum(1 for p in people.values() if p['sex'] == 'M')
-    num_females = sum(1 for p in people.values() if p['sex'] == 'F')
-    num_deceased = sum(1 for p in people.values() if p['is_deceased'])
+    num_males = sim.people.sex.count('M')
+    num_females = sim.people.sex.count('F')
+    num_deceased = sum(sim.people.is_deceased)
 
     print(
         f"Males: {num_males}, Females: {num_females}, Deceased: {num_deceased}")
     print(
-        f"Marriages: {len(marriages)}, Current marriages: {sum(1 for m in marriages if m['current'])}")
+        f"Marriages: {len(sim.marriages)}, Current marriages: {len(sim.active_marriages)}")
 
     return output_file
 
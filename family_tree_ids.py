@@ -0,0 +1,80 @@
+"""
+Exported ID schemes for people and legacy buckets.
+
+- uuid4: random UUIDs (the original scheme)
+- uuid7: time-ordered UUIDs (RFC 9562 version 7), which sort in creation
+  order, so database inserts append to the primary key index
+- integer: dense integers counting up from 1, which the database can use as
+  its row IDs (see sql_import_exporter.create_database_schema)
+"""
+
+import random
+import time
+import uuid
+
+ID_SCHEMES = ['uuid4', 'uuid7', 'integer']
+
+UUID7_COUNTER_BITS = 42  # 12 bits of rand_a and the top 30 bits of rand_b
+
+
+def format_uuid(value):
+    """Canonical string form of a 128-bit UUID value"""
+    digits = f'{value:032x}'
+    return f'{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}'
+
+
+def detect_id_scheme(value):
+    """Scheme of an exported ID, None if it is not one of ID_SCHEMES"""
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, str) and len(value) == 36 and value[14] in '47':
+        return 'uuid' + value[14]
+    return None
+
+
+class IdFactory:
+    """Source of new exported IDs in one of the ID_SCHEMES
+
+    `start` is the first integer ID, e.g. one past the largest ID of a loaded
+    dataset. Version 7 UUIDs count up within a millisecond (RFC 9562 method 1),
+    so they keep increasing however fast they are drawn.
+    """
+
+    def __init__(self, scheme='uuid4', start=1):
+        if scheme not in ID_SCHEMES:
+            raise ValueError(f"Unknown ID scheme '{scheme}', expected one of {ID_SCHEMES}")
+        self.scheme = scheme
+        self.next_integer = start
+        self.last_ms = 0
+        self.counter = 0
+        # Own RNG so drawing IDs never disturbs the simulation's random stream
+        self.random = random.Random()
+
+    def new_id(self):
+        if self.scheme == 'integer':
+            self.next_integer += 1
+            return self.next_integer - 1
+        if self.scheme == 'uuid7':
+            return self._uuid7()
+        return str(uuid.uuid4())
+
+    def new_ids(self, count):
+        return [self.new_id() for _ in range(count)]
+
+    def _uuid7(self):
+        ms = time.time_ns() // 1000000
+        if ms > self.last_ms:
+            self.last_ms = ms
+            self.counter = 0
+        else:
+            self.counter += 1
+            if self.counter >> UUID7_COUNTER_BITS:
+                # Counter exhausted, borrow the next millisecond
+                self.last_ms += 1
+                self.counter = 0
+
+        counter_high = self.counter >> 30
+        counter_low = self.counter & 0x3FFFFFFF
+        value = ((self.last_ms << 80) | (0x7 << 76) | (counter_high << 64) |
+                 (0b10 << 62) | (counter_low << 32) | self.random.getrandbits(32))
+        return format_uuid(value)
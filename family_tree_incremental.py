@@ -0,0 +1,148 @@
+"""
+Incremental extension of an existing family tree dataset.
+
+A generated tree (JSON, NDJSON or the SQLite database built from it) is
+loaded back into a FamilySimulation, people still alive get a chance to die
+in the added years, new founding families can be added, and only the added
+years are simulated. The output holds just the delta: new people and
+marriages, plus existing people and marriages that changed (deaths, married
+names, divorces). Importing it into the database with import_from_json
+updates the changed records in place. With --full, the whole extended tree is
+written instead, for the database to be synced with it (see sync_from_json).
+
+Usage:
+    python family_tree_incremental.py family_tree.json --years 10 --output delta.json
+"""
+
+import argparse
+import sqlite3
+
+from family_tree_generator import FamilySimulation
+from family_tree_ids import ID_SCHEMES, detect_id_scheme
+from family_tree_reader import iter_records
+from family_tree_writer import write_family_tree
+from sql_import_exporter import read_marriages, read_people
+
+
+def read_dataset(path):
+    """People and marriage records of a generated tree (JSON, NDJSON or SQLite)"""
+    if path.endswith(('.db', '.sqlite')):
+        conn = sqlite3.connect(path)
+        people = list(read_people(conn))
+        has_marriages = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Marriage'").fetchone()
+        marriages = list(read_marriages(conn)) if has_marriages else []
+        conn.close()
+        return people, marriages
+
+    people = []
+    marriages = []
+    for kind, record in iter_records(path):
+        (marriages if kind == 'marriage' else people).append(record)
+    return people, marriages
+
+
+def extend_lifespans(sim, from_year):
+    """Let people alive in from_year die during the added years; returns their IDs"""
+    people = sim.people
+    died = []
+    for pid in range(len(people)):
+        if people.is_deceased[pid]:
+            continue
+
+        birth_year = people.birth_year[pid]
+        for year in range(from_year, sim.CURRENT_YEAR):
+            age = year - birth_year
+            yearly_prob = sim.PROB_DEATH_YEARLY + max(age - 70, 0) * 0.01
+            if age > sim.MAX_AGE or sim.rng.random() < yearly_prob:
+                _, month, day = sim.create_date(year)
+                people.is_deceased[pid] = True
+                people.death_year[pid] = year
+                people.death_month[pid] = month
+                people.death_day[pid] = day
+                people.cause_of_death[pid] = sim.rng.choice(sim.CAUSES_OF_DEATH)
+                sim.deaths_by_year.setdefault(year, []).append(pid)
+                died.append(pid)
+                break
+    return died
+
+
+def extend_family_tree(input_path, output_file, years=10, num_families=0, from_year=None,
+                       compact=None, id_scheme=None, full=False):
+    """Simulate `years` more years of an existing tree and write only what changed,
+    or with `full` everyone
+
+    `from_year` is the first year to simulate, by default the year the
+    generator stops at (CURRENT_YEAR). New founding families are born 30 to
+    60 years before it, so they arrive with grown-up children. New IDs follow
+    `id_scheme`, by default the scheme of the existing IDs.
+    """
+    if from_year is None:
+        from_year = FamilySimulation.CURRENT_YEAR
+    people, marriages = read_dataset(input_path)
+    if id_scheme is None:
+        id_scheme = (detect_id_scheme(people[0]['id']) if people else None) or 'uuid4'
+    sim = FamilySimulation(current_year=from_year + years, id_scheme=id_scheme)
+
+    sim.load_records(people, marriages)
+    num_loaded = len(sim.people)
+    num_loaded_marriages = len(sim.marriages)
+    print(f"Loaded {num_loaded} people and {num_loaded_marriages} marriages from {input_path}")
+
+    names_before = [(sim.people.last_name[pid], sim.people.maiden_name[pid])
+                    for pid in range(num_loaded)]
+    current_before = [marriage['current'] for marriage in sim.marriages]
+
+    died = extend_lifespans(sim, from_year)
+    if num_families:
+        sim.build_initial_population(num_families, first_birth_year=from_year - 60)
+
+    # Only the classic engine continues from a given year
+    sim.resume_year = from_year
+    sim.simulate_generations(num_generations=None)
+
+    renamed = [pid for pid in range(num_loaded)
+               if (sim.people.last_name[pid], sim.people.maiden_name[pid]) != names_before[pid]]
+    person_ids = sorted(set(died).union(renamed)) + list(range(num_loaded, len(sim.people)))
+    marriage_indexes = [
+        index for index in range(num_loaded_marriages)
+        if sim.marriages[index]['current'] != current_before[index]
+    ] + list(range(num_loaded_marriages, len(sim.marriages)))
+
+    ids = sim.export_ids()
+    if full:
+        write_family_tree(output_file, sim.iter_people(ids), sim.iter_marriages(ids),
+                          len(sim.people), compact=compact)
+    else:
+        write_family_tree(output_file, sim.iter_people(ids, person_ids),
+                          sim.iter_marriages(ids, marriage_indexes), len(person_ids),
+                          compact=compact)
+
+    num_new = len(sim.people) - num_loaded
+    print(f"Simulated {from_year}-{sim.CURRENT_YEAR - 1}: {num_new} new people, "
+          f"{len(person_ids) - num_new} updated, {len(marriage_indexes)} new or changed marriages")
+    print(f"{'Extended tree' if full else 'Delta'} saved to {output_file}")
+    return output_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Extend an existing family tree and write only the new and changed records')
+    parser.add_argument('input', help='Existing tree (.json, .ndjson, optionally .gz/.zst, or .db)')
+    parser.add_argument('--output', default='family_tree_delta.json',
+                        help='Delta output file')
+    parser.add_argument('--years', type=int, default=10,
+                        help='Number of years to simulate')
+    parser.add_argument('--families', type=int, default=0,
+                        help='Number of new founding families to add')
+    parser.add_argument('--from-year', type=int,
+                        help='First year to simulate (default: the generator\'s current year)')
+    parser.add_argument('--id-scheme', choices=ID_SCHEMES,
+                        help='IDs of new people (default: the scheme of the existing IDs)')
+    parser.add_argument('--full', action='store_true',
+                        help='Write the whole extended tree instead of the delta, e.g. over the '
+                             'family_tree.json of a workflow run to update it with --sync')
+    args = parser.parse_args()
+
+    extend_family_tree(args.input, args.output, years=args.years, num_families=args.families,
+                       from_year=args.from_year, id_scheme=args.id_scheme, full=args.full)
@@ -0,0 +1,221 @@
+"""
+Kinship between the people of a family tree.
+
+KinshipEngine works on parent arrays (the father and mother of every person,
+by dense integer ID) built from a running simulation, a generated JSON or
+NDJSON tree or the SQLite database. Ancestor sets are computed from the
+parents' sets and kept in LRU caches, so once the ancestors of a population
+have been visited each pair query is a few dictionary lookups:
+
+    engine = KinshipEngine.from_json('family_tree.json')
+    engine.relationship(person1_id, person2_id)  # e.g. 'second cousin once removed'
+    engine.lowest_common_ancestors(person1_id, person2_id)
+    engine.kinship_coefficient(person1_id, person2_id)
+"""
+
+from functools import lru_cache
+
+from family_tree_reader import iter_records
+from family_tree_store import NO_PERSON
+
+CACHE_SIZE = 1 << 18  # Entries per cache (ancestor maps, near ancestors, coefficients)
+
+ORDINALS = ['first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh',
+            'eighth', 'ninth', 'tenth']
+REMOVALS = ['once', 'twice', 'thrice']
+
+
+def _ordinal(n):
+    return ORDINALS[n - 1] if n <= len(ORDINALS) else f'{n}th'
+
+
+def _removal(n):
+    return REMOVALS[n - 1] if n <= len(REMOVALS) else f'{n} times'
+
+
+def _lineal(depth, word):
+    """'parent', 'grandparent', 'great-grandparent', ... for depth 1, 2, 3, ..."""
+    if depth == 1:
+        return word
+    return 'great-' * (depth - 2) + 'grand' + word
+
+
+def relationship_name(depth1, depth2, half=False):
+    """Name of what person 2 is to person 1, given the generations from each up
+    to their nearest common ancestor (0 when that is the person themselves)"""
+    if depth1 == depth2 == 0:
+        return 'self'
+    if depth2 == 0:
+        return _lineal(depth1, 'parent')
+    if depth1 == 0:
+        return _lineal(depth2, 'child')
+
+    prefix = 'half-' if half else ''
+    if depth1 == depth2 == 1:
+        return prefix + 'sibling'
+    if depth1 == 1:
+        # Person 2 descends from a sibling of person 1
+        if depth2 == 2:
+            return prefix + 'niece/nephew'
+        return prefix + 'great-' * (depth2 - 3) + 'grandniece/grandnephew'
+    if depth2 == 1:
+        # Person 2 is a sibling of an ancestor of person 1
+        return prefix + 'great-' * (depth1 - 2) + 'aunt/uncle'
+
+    name = f'{_ordinal(min(depth1, depth2) - 1)} cousin'
+    removed = abs(depth1 - depth2)
+    if removed:
+        name += f' {_removal(removed)} removed'
+    return ('half ' if half else '') + name
+
+
+class KinshipEngine:
+    """Relationships, common ancestors and kinship coefficients from parent arrays
+
+    `father` and `mother` hold the parents of each person by integer ID, with
+    NO_PERSON for unknown parents; they may keep growing (e.g. the columns of
+    a running simulation's PersonStore), since a person's ancestors never
+    change once they are created. With `ids` (the exported IDs of the people,
+    in integer ID order), queries take and return exported IDs instead.
+    """
+
+    def __init__(self, father, mother, ids=None, cache_size=CACHE_SIZE):
+        self.father = father
+        self.mother = mother
+        self.ids = ids
+        self.index = {pid: index for index, pid in enumerate(ids)} if ids is not None else None
+        self.ancestor_depths = lru_cache(maxsize=cache_size)(self._ancestor_depths)
+        self.near_ancestors = lru_cache(maxsize=cache_size)(self._near_ancestors)
+        self._kinship = lru_cache(maxsize=cache_size)(self._kinship_uncached)
+
+    @classmethod
+    def from_store(cls, people, cache_size=CACHE_SIZE):
+        """Engine over the people of a PersonStore, following its growth"""
+        return cls(people.father_id, people.mother_id, cache_size=cache_size)
+
+    @classmethod
+    def from_records(cls, records, cache_size=CACHE_SIZE):
+        """Engine over exported person records, queried by exported ID
+
+        Parents that are not among the records count as unknown.
+        """
+        ids, parents = [], []
+        for person in records:
+            ids.append(person['id'])
+            parents.append((person['father_id'], person['mother_id']))
+        index = {pid: i for i, pid in enumerate(ids)}
+        father = [index.get(father_id, NO_PERSON) for father_id, _ in parents]
+        mother = [index.get(mother_id, NO_PERSON) for _, mother_id in parents]
+        return cls(father, mother, ids, cache_size)
+
+    @classmethod
+    def from_json(cls, path, cache_size=CACHE_SIZE):
+        """Engine over a generated JSON or NDJSON tree (optionally compressed)"""
+        return cls.from_records(
+            (record for kind, record in iter_records(path) if kind == 'person'), cache_size)
+
+    @classmethod
+    def from_db(cls, conn, cache_size=CACHE_SIZE):
+        """Engine over the Person table of an SQLite database connection"""
+        rows = conn.execute('SELECT id, father_id, mother_id FROM Person ORDER BY rowid')
+        return cls.from_records(
+            ({'id': pid, 'father_id': father_id, 'mother_id': mother_id}
+             for pid, father_id, mother_id in rows), cache_size)
+
+    def _to_index(self, person_id):
+        return self.index[person_id] if self.index is not None else person_id
+
+    def _to_id(self, index):
+        return self.ids[index] if self.ids is not None else index
+
+    def parents(self, index):
+        return [parent for parent in (self.father[index], self.mother[index])
+                if parent != NO_PERSON]
+
+    def _ancestor_depths(self, index):
+        """Maps the ancestors of a person (and the person, at depth 0) to the
+        fewest generations up to them"""
+        depths = {index: 0}
+        for parent in self.parents(index):
+            for ancestor, depth in self.ancestor_depths(parent).items():
+                if depth + 1 < depths.get(ancestor, depth + 2):
+                    depths[ancestor] = depth + 1
+        return depths
+
+    def _near_ancestors(self, index, generations):
+        """The person and their ancestors up to `generations` back, as a frozenset"""
+        if not generations:
+            return frozenset((index,))
+        near = {index}
+        for parent in self.parents(index):
+            near |= self.near_ancestors(parent, generations - 1)
+        return frozenset(near)
+
+    def share_ancestor(self, person1_id, person2_id, generations):
+        """Whether two people have a common ancestor (either of them counting
+        as their own) at most `generations` back from both"""
+        return not self.near_ancestors(self._to_index(person1_id), generations).isdisjoint(
+            self.near_ancestors(self._to_index(person2_id), generations))
+
+    def _lowest_common_ancestors(self, index1, index2):
+        depths1 = self.ancestor_depths(index1)
+        depths2 = self.ancestor_depths(index2)
+        if len(depths1) > len(depths2):
+            common = [ancestor for ancestor in depths2 if ancestor in depths1]
+        else:
+            common = [ancestor for ancestor in depths1 if ancestor in depths2]
+        # A common ancestor is lowest when it is no ancestor of another common ancestor
+        lowest = [ancestor for ancestor in common
+                  if not any(other != ancestor and ancestor in self.ancestor_depths(other)
+                             for other in common)]
+        return sorted(((ancestor, depths1[ancestor], depths2[ancestor]) for ancestor in lowest),
+                      key=lambda row: (row[1] + row[2], row[0]))
+
+    def lowest_common_ancestors(self, person1_id, person2_id):
+        """(ancestor, generations from person 1, generations from person 2) of
+        the lowest common ancestors of two people, nearest first
+
+        Either person counts as their own ancestor, so a parent is the lowest
+        common ancestor of themselves and their child.
+        """
+        return [(self._to_id(ancestor), depth1, depth2)
+                for ancestor, depth1, depth2 in self._lowest_common_ancestors(
+                    self._to_index(person1_id), self._to_index(person2_id))]
+
+    def relationship(self, person1_id, person2_id):
+        """What person 2 is to person 1 (e.g. 'first cousin once removed'),
+        None if they are not related by descent"""
+        lowest = self._lowest_common_ancestors(
+            self._to_index(person1_id), self._to_index(person2_id))
+        if not lowest:
+            return None
+        _, depth1, depth2 = lowest[0]
+        # Full relatives descend from a couple, half relatives from one person
+        half = sum(1 for _, d1, d2 in lowest if (d1, d2) == (depth1, depth2)) < 2
+        return relationship_name(depth1, depth2, half)
+
+    def _kinship_uncached(self, index1, index2):
+        if index1 == index2:
+            father, mother = self.father[index1], self.mother[index1]
+            inbreeding = (self._kinship(*sorted((father, mother)))
+                          if NO_PERSON not in (father, mother) else 0.0)
+            return 0.5 * (1.0 + inbreeding)
+
+        # Recurse on the parents of whichever person is not an ancestor of the other
+        if index1 in self.ancestor_depths(index2):
+            index1, index2 = index2, index1
+        return 0.5 * sum(self._kinship(*sorted((parent, index2)))
+                         for parent in self.parents(index1))
+
+    def kinship_coefficient(self, person1_id, person2_id):
+        """Probability that an allele drawn from each of two people is identical
+        by descent: 1/2 for oneself, 1/4 for parent and child or full siblings,
+        1/16 for first cousins, 0 for unrelated people"""
+        return self._kinship(*sorted((self._to_index(person1_id), self._to_index(person2_id))))
+
+    def inbreeding_coefficient(self, person_id):
+        """Kinship coefficient of a person's parents, 0 if either is unknown"""
+        index = self._to_index(person_id)
+        if NO_PERSON in (self.father[index], self.mother[index]):
+            return 0.0
+        return self._kinship(*sorted((self.father[index], self.mother[index])))
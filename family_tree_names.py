@@ -0,0 +1,50 @@
+"""
+Cached name sampling for the family tree generator.
+
+The `names` package re-reads its frequency files on every call. NameSampler
+loads each table once per process and draws names by bisection over the
+cumulative frequencies. It offers the same get_first_name/get_last_name calls
+and makes the same draws, so for a given RNG state it returns the same names.
+"""
+
+import random
+from bisect import bisect_right
+
+import names
+
+_tables = {}  # Maps names.FILES keys to (cumulative frequencies, capitalized names)
+
+
+def load_table(key):
+    """Cumulative frequencies and names of one of the `names` package tables"""
+    if key not in _tables:
+        cumulative = []
+        values = []
+        with open(names.FILES[key]) as name_file:
+            for line in name_file:
+                name, _, cumulative_frequency, _ = line.split()
+                cumulative.append(float(cumulative_frequency))
+                values.append(name.capitalize())
+        _tables[key] = (cumulative, values)
+    return _tables[key]
+
+
+class NameSampler:
+    """Drop-in replacement for the `names` module drawing from an RNG of choice"""
+
+    def __init__(self, rng=random):
+        self.rng = rng
+
+    def get_name(self, key):
+        cumulative, values = load_table(key)
+        # Same draw as the `names` package: first entry whose cumulative frequency exceeds it
+        index = bisect_right(cumulative, self.rng.random() * 90)
+        return values[index] if index < len(values) else ""
+
+    def get_first_name(self, gender=None):
+        if gender not in ('male', 'female'):
+            gender = self.rng.choice(('male', 'female'))
+        return self.get_name('first:%s' % gender)
+
+    def get_last_name(self):
+        return self.get_name('last')
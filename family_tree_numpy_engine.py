@@ -0,0 +1,332 @@
+"""
+Vectorized yearly simulation step for the family tree generator.
+
+Each year the marriage, divorce and birth phases are run as batches over the
+whole population: random vectors are drawn with NumPy and applied as masks on
+integer age, sex and marital status arrays. Only the resulting events
+(marriages, divorces, births) go through the generator's per-person functions.
+
+The populations produced are statistically equivalent to the classic engine's,
+not identical for a given seed. fill_attributes_numpy is the batch counterpart
+of the per-person attribute draws of lazy simulations.
+"""
+
+import numpy as np
+
+from family_tree_pools import generate_pools
+
+MAX_CHILDREN_PER_MOTHER = 10
+
+
+def _sex_mask(sim, sex_codes, sex):
+    """Boolean mask of the people with the given sex"""
+    return sex_codes == sim.people.sex.vocabulary.codes.get(sex, -1)
+
+
+def _active_marriage_arrays(sim):
+    """Indexes, spouses and years of the current marriages as arrays"""
+    count = len(sim.active_marriages)
+    index = np.fromiter(sim.active_marriages.keys(), dtype=np.int64, count=count)
+    person1 = np.fromiter((m['person1_id'] for m in sim.active_marriages.values()),
+                          dtype=np.int64, count=count)
+    person2 = np.fromiter((m['person2_id'] for m in sim.active_marriages.values()),
+                          dtype=np.int64, count=count)
+    year = np.fromiter((m['year'] for m in sim.active_marriages.values()),
+                       dtype=np.int64, count=count)
+    return index, person1, person2, year
+
+
+def _pick_spouses(sim, rng, proposers, pool, birth_year, year):
+    """Pick a random spouse from the pool within the allowed age gap of each proposer
+
+    Returns the proposers that found someone and their picks.
+    """
+    max_age_diff = sim.max_spouse_age_gap(year)
+    if not len(proposers) or not len(pool):
+        return proposers[:0], proposers[:0]
+
+    pool = pool[np.argsort(birth_year[pool], kind='stable')]
+    pool_birth = birth_year[pool]
+    proposer_birth = birth_year[proposers]
+
+    low = np.searchsorted(pool_birth, proposer_birth - max_age_diff, side='left')
+    high = np.searchsorted(
+        pool_birth, np.minimum(proposer_birth + max_age_diff, year - sim.MARRIAGE_MIN_AGE),
+        side='right')
+    available = high - low
+    matched = available > 0
+
+    offsets = (rng.random(len(proposers)) * available).astype(np.int64)
+    return proposers[matched], pool[(low + offsets)[matched]]
+
+
+def _process_marriages(sim, rng, year, adult, married, male, female, birth_year):
+    """Marry about 10% of the unmarried adults to a random suitable partner"""
+    unmarried = adult & ~married
+    if sim.outside_proposals:
+        # Whoever searches outside is off the market until that is settled
+        unmarried[list(sim.outside_proposals)] = False
+    proposing = unmarried & (rng.random(len(unmarried)) < 0.1)
+    if sim.outside_share:
+        proposing[[pid for pid in np.flatnonzero(proposing).tolist()
+                   if sim.looks_outside(pid)]] = False
+
+    brides = unmarried & female
+    if year < 1970:
+        # Allow polygamy for males in older times
+        brides |= adult & female & married & (rng.random(len(married)) < sim.PROB_POLYGAMY)
+    grooms = unmarried & male
+
+    men = np.flatnonzero(proposing & male)
+    women = np.flatnonzero(proposing & female)
+    # As in the classic engine, whoever marries stops being a candidate for the
+    # rest of the year; proposals that lost their pick are retried once
+    for _ in range(2):
+        men, wives = _pick_spouses(sim, rng, men, np.flatnonzero(brides), birth_year, year)
+        women, husbands = _pick_spouses(sim, rng, women, np.flatnonzero(grooms), birth_year, year)
+
+        proposers = np.concatenate([men, women])
+        spouses = np.concatenate([wives, husbands])
+        order = np.argsort(proposers, kind='stable')
+
+        unmatched = []
+        for pid, spouse_id in zip(proposers[order].tolist(), spouses[order].tolist()):
+            if not (brides[spouse_id] or grooms[spouse_id]):
+                unmatched.append(pid)
+            elif sim.is_close_relative(pid, spouse_id):
+                unmatched.append(pid)
+            elif sim.simulate_marriage(pid, spouse_id, year):
+                brides[[pid, spouse_id]] = False
+                grooms[[pid, spouse_id]] = False
+
+        unmatched = np.array(unmatched, dtype=np.int64)
+        men = unmatched[male[unmatched]]
+        women = unmatched[female[unmatched]]
+
+    if sim.outside_share:
+        # Proposals that found no one here are left to the outside
+        for pid in np.flatnonzero(proposing).tolist():
+            if brides[pid] or grooms[pid]:
+                sim.propose_outside(pid)
+
+
+def simulate_generations_numpy(sim, num_generations=3, until=None):
+    """Vectorized counterpart of FamilySimulation.simulate_generations"""
+    sim.num_generations = num_generations
+    # Seed from the simulation's RNG so seeded runs stay reproducible
+    rng = np.random.default_rng(sim.rng.getrandbits(64))
+
+    for current_year in sim.simulated_years(until):
+        if sim.target_population and len(sim.people) >= sim.target_population:
+            print(f"Reached the target population of {sim.target_population} in {current_year}")
+            break
+
+        sim.prune_candidate_index(current_year)
+
+        # Population arrays (copies, as the store keeps growing during the year)
+        birth_year = np.array(sim.people.birth_year, dtype=np.int64)
+        death_year = np.array(sim.people.death_year, dtype=np.int64)
+        is_deceased = np.array(sim.people.is_deceased, dtype=bool)
+        sex_codes = np.array(sim.people.sex.codes)
+        mother_ids = np.array(sim.people.mother_id, dtype=np.int64)
+
+        male = _sex_mask(sim, sex_codes, 'M')
+        female = _sex_mask(sim, sex_codes, 'F')
+        age = current_year - birth_year
+        alive = ~(is_deceased & (death_year < current_year)) & (age >= 0)
+        fertile = alive & (age >= sim.FERTILITY_START_AGE) & (
+            (female & (age <= sim.FERTILITY_END_AGE_FEMALE)) |
+            (male & (age <= sim.FERTILITY_END_AGE_MALE)))
+
+        if sim.num_generations is not None:
+            # Only people before the last generation have children
+            can_parent = np.array(sim.people.generation, dtype=np.int64) < sim.num_generations
+            if not (alive & female & (age <= sim.FERTILITY_END_AGE_FEMALE) & can_parent).any():
+                print(f"No one left to have children within {sim.num_generations} "
+                      f"generations in {current_year}, stopping")
+                break
+            fertile &= can_parent
+
+        # Current marriages registered on or before this year
+        marriage_index, spouse1, spouse2, marriage_year = _active_marriage_arrays(sim)
+        married = np.zeros(len(sim.people), dtype=bool)
+        started = marriage_year <= current_year
+        married[spouse1[started]] = True
+        married[spouse2[started]] = True
+
+        # Process marriages
+        _process_marriages(sim, rng, current_year, alive & (age >= sim.MARRIAGE_MIN_AGE),
+                           married, male, female, birth_year)
+
+        # Process divorces among marriages from previous years
+        established = marriage_year < current_year
+        divorcing = established & (
+            rng.random(len(marriage_index)) < sim.PROB_DIVORCE / 50)
+        for index in marriage_index[divorcing].tolist():
+            sim.end_marriage(index)
+
+        # Process childbirths
+        # First for married couples
+        couples = established & ~divorcing
+        spouse1, spouse2 = spouse1[couples], spouse2[couples]
+        husband_first = male[spouse1]
+        fathers = np.where(husband_first, spouse1, spouse2)
+        mothers = np.where(husband_first, spouse2, spouse1)
+
+        children = np.bincount(mother_ids[mother_ids >= 0], minlength=len(sim.people))
+        births = (fertile[mothers] & (children[mothers] < MAX_CHILDREN_PER_MOTHER) &
+                  (rng.random(len(mothers)) < 0.2))
+        for father_id, mother_id in zip(fathers[births].tolist(), mothers[births].tolist()):
+            sim.simulate_child(father_id, mother_id, current_year)
+
+        # Then for out-of-wedlock births
+        women = np.flatnonzero(fertile & female)
+        mothers = women[rng.random(len(women)) < sim.PROB_OUT_OF_WEDLOCK / 10]
+        unknown_father = rng.random(len(mothers)) < sim.PROB_UNKNOWN_FATHER
+        father_pool = np.flatnonzero(fertile & male)
+        if len(father_pool):
+            fathers = father_pool[rng.integers(len(father_pool), size=len(mothers))]
+        else:
+            unknown_father[:] = True
+            fathers = mothers
+
+        birth_offsets = rng.integers(-5, 6, size=len(mothers))
+        for mother_id, father_id, unknown, offset in zip(
+                mothers.tolist(), fathers.tolist(), unknown_father.tolist(),
+                birth_offsets.tolist()):
+            if unknown:
+                father_id = sim.create_unknown_parent(
+                    is_male=True, birth_year=int(birth_year[mother_id]) + offset,
+                    generation=sim.people.generation[mother_id])
+            sim.simulate_child(father_id, mother_id, current_year)
+
+        # Create orphans and children with unknown parents
+        # 5% chance each year to add an orphan, split between the shards of a parallel run
+        if rng.random() < 0.05 * (1 - sim.outside_share):
+            sim.create_orphan(current_year)
+    else:
+        sim.pause(until)
+
+
+def _column(column):
+    """Writable NumPy view of an array column (or of the codes of a category column)"""
+    column = getattr(column, 'codes', column)
+    return np.frombuffer(column, dtype=column.typecode)
+
+
+def _inherited(rng, codes, known, father, mother, share):
+    """Codes taken from a random parent for `share` of the people with known parents,
+    0 (no value) for the others"""
+    from_father = rng.random(len(known)) < 0.5
+    picked = np.where(from_father, codes[np.where(known, father, 0)],
+                      codes[np.where(known, mother, 0)])
+    return np.where(known & share, picked, 0)
+
+
+def _drawn(rng, codes, choices):
+    """Fill the codes that are still 0 with uniformly drawn choices"""
+    return np.where(codes == 0, choices[rng.integers(len(choices), size=len(codes))], codes)
+
+
+def fill_attributes_numpy(sim, person_ids):
+    """Draw the attributes of many people of a lazy simulation as vectorized batches
+
+    Batch counterpart of FamilySimulation._draw_attributes, with the same
+    distributions. Everything is drawn from one NumPy generator seeded with
+    the attribute seed and the first person ID, and cities, countries,
+    addresses and jobs are taken from the simulation's attribute pools by
+    index vectors. People are filled one generation at a time, so children
+    inherit from parents filled in the same call.
+    """
+    people = sim.people
+    pools = generate_pools(sim.attribute_pool_size, sim.attribute_seed)
+    person_ids = np.asarray(person_ids, dtype=np.int64)
+    rng = np.random.default_rng([sim.attribute_seed, int(person_ids[0])])
+
+    # Encode every drawable value first, as encoding may widen the code arrays
+    blood_types = np.array(people.blood_type.encode_all(sim.BLOOD_TYPES))
+    blood_weights = np.array(sim.BLOOD_TYPE_DIST) / sum(sim.BLOOD_TYPE_DIST)
+    eye_colors = np.array(people.eye_color.encode_all(sim.EYE_COLORS))
+    hair_colors = np.array(people.hair_color.encode_all(sim.HAIR_COLORS))
+    nationalities = np.array(people.nationality.encode_all(sim.NATIONALITIES))
+    ethnicities = np.array(people.ethnicity.encode_all(sim.ETHNICITIES))
+    religions = np.array(people.religion.encode_all(sim.RELIGIONS))
+    education_levels = np.array(people.education.encode_all(sim.EDUCATION_LEVELS))
+    cities, countries = pools['city'], pools['country']
+    addresses, jobs = pools['address'], pools['job']
+    job_draws = rng.integers(len(jobs), size=len(person_ids))
+    used_jobs = np.unique(job_draws)
+    job_codes = np.zeros(len(jobs), dtype=np.int64)
+    job_codes[used_jobs] = people.occupation.encode_all(jobs[i] for i in used_jobs.tolist())
+
+    male_code = people.sex.vocabulary.codes.get('M', -1)
+    generation = _column(people.generation)[person_ids]
+    for cohort in np.unique(generation).tolist():
+        cohort_rows = generation == cohort
+        ids = person_ids[cohort_rows]
+        n = len(ids)
+        male = _column(people.sex)[ids] == male_code
+        birth_year = _column(people.birth_year)[ids].astype(np.int64)
+        is_deceased = _column(people.is_deceased)[ids].astype(bool)
+        age = sim.CURRENT_YEAR - birth_year
+        father = _column(people.father_id)[ids].astype(np.int64)
+        mother = _column(people.mother_id)[ids].astype(np.int64)
+        known = ((father >= 0) & (father < len(people)) &
+                 (mother >= 0) & (mother < len(people)))
+
+        # Physical characteristics, eye and hair color inherited 80% of the time
+        _column(people.blood_type)[ids] = blood_types[
+            rng.choice(len(blood_types), size=n, p=blood_weights)]
+        inherit = rng.random(n) < 0.8
+        for column, choices in ((people.eye_color, eye_colors),
+                                (people.hair_color, hair_colors)):
+            codes = _column(column)
+            codes[ids] = _drawn(rng, _inherited(rng, codes, known, father, mother, inherit),
+                                choices)
+        _column(people.height_cm)[ids] = np.where(
+            male, rng.integers(150, 201, size=n), rng.integers(145, 186, size=n))
+
+        # Contact info, less likely for older people
+        has_email = (age >= 10) & (age <= 90) & (rng.random(n) < 0.9 - age / 100)
+        domains = rng.integers(len(sim.EMAIL_DOMAINS), size=n)
+        for pid, domain in zip(ids[has_email].tolist(), domains[has_email].tolist()):
+            people.email[pid] = (f"{people.first_name[pid].lower()}."
+                                 f"{people.last_name[pid].lower()}@{sim.EMAIL_DOMAINS[domain]}")
+        has_phone = (age >= 12) & (rng.random(n) < 0.95 - age / 200)
+        phone_parts = zip(ids[has_phone].tolist(),
+                          rng.integers(200, 1000, size=n)[has_phone].tolist(),
+                          rng.integers(100, 1000, size=n)[has_phone].tolist(),
+                          rng.integers(1000, 10000, size=n)[has_phone].tolist())
+        for pid, area, exchange, line in phone_parts:
+            people.phone[pid] = f"+1-{area}-{exchange}-{line}"
+
+        # Cultural background, from the parents 90% of the time (religion 80% of that)
+        inherit = rng.random(n) < 0.9
+        follow_religion = inherit & (rng.random(n) < 0.8)
+        for column, choices, share in ((people.nationality, nationalities, inherit),
+                                       (people.ethnicity, ethnicities, inherit),
+                                       (people.religion, religions, follow_religion)):
+            codes = _column(column)
+            codes[ids] = _drawn(rng, _inherited(rng, codes, known, father, mother, share),
+                                choices)
+
+        # Location data
+        for pid, city, country in zip(ids.tolist(),
+                                      rng.integers(len(cities), size=n).tolist(),
+                                      rng.integers(len(countries), size=n).tolist()):
+            people.place_of_birth[pid] = cities[city] + ", " + countries[country]
+        has_address = ~is_deceased & (age >= 18)
+        for pid, address in zip(ids[has_address].tolist(),
+                                rng.integers(len(addresses), size=n)[has_address].tolist()):
+            people.address[pid] = addresses[address]
+
+        # Education and occupation of adults
+        adult = age >= 18
+        _column(people.education)[ids] = np.where(
+            adult, education_levels[rng.integers(len(education_levels), size=n)], 0)
+        working = adult & (~is_deceased | (age >= 22))
+        _column(people.occupation)[ids] = np.where(
+            working, job_codes[job_draws[cohort_rows]], 0)
+
+        _column(people.has_legacy_bucket)[ids] = rng.random(n) < 0.3
+        _column(people.has_attributes)[ids] = 1
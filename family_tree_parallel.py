@@ -0,0 +1,368 @@
+"""
+Parallel generation of independent family lines.
+
+The initial families are split into shards, and each shard is built and
+simulated in a worker process by its own FamilySimulation, seeded from the
+target simulation's RNG and sharing its settings, so a run is reproducible
+whatever the scheduling of the workers. Shards are simulated in epochs of
+EPOCH_YEARS. Within a shard, the share of spouse searches that would find a
+partner in the other shards is set aside (see FamilySimulation.looks_outside);
+between epochs, those people marry unmarried adults of the other shards, and
+the bride moves to her husband's shard (a copy of her is added there and she
+leaves her own shard). With RELATIVE_EXCLUSION_GENERATIONS, the shards send
+the near ancestors of their singles along, and those of the brides who move
+are kept, so close relatives are also kept apart across shards. At the end,
+the shards are merged into the target simulation, with person IDs and parent
+links shifted to the merged numbering and every moved person folded back into
+a single record.
+"""
+
+import multiprocessing
+import random
+
+from family_tree_generator import FamilySimulation
+
+EPOCH_YEARS = 5  # Years simulated by the shards between rounds of cross-shard marriages
+
+
+def _create_shard(num_families, num_generations, seed, attribute_pool_size, attribute_seed,
+                  lazy_attributes, batch_attributes, target_population, settings):
+    """Build one shard of family lines"""
+    shard = FamilySimulation(seed=seed, attribute_pool_size=attribute_pool_size,
+                             attribute_seed=attribute_seed, lazy_attributes=lazy_attributes,
+                             batch_attributes=batch_attributes, **settings)
+    shard.num_generations = num_generations
+    shard.target_population = target_population
+    shard.build_initial_population(num_families)
+    return shard
+
+
+def run_shard(shard, num_generations, engine, until, outside_share):
+    """Simulate a shard up to `until`, returning whether it paused there"""
+    shard.outside_share = outside_share
+    # Searches left unmatched (when no other shard was running) are given up
+    shard.outside_proposals = {}
+    shard.run_simulation(num_generations, engine, until)
+    return shard.resume_year is not None
+
+
+def near_ancestors(shard, pid):
+    """Maps a person of a shard and their ancestors up to
+    RELATIVE_EXCLUSION_GENERATIONS back to the fewest generations up to them"""
+    depths = {pid: 0}
+    generation = [pid]
+    for depth in range(1, shard.RELATIVE_EXCLUSION_GENERATIONS + 1):
+        generation = [parent for child in generation
+                      for parent in (shard.people.father_id[child], shard.people.mother_id[child])
+                      if parent in shard.people and parent not in depths]
+        for parent in generation:
+            depths[parent] = depth
+    return depths
+
+
+def find_singles(shard, year):
+    """The unmarried living adults of a shard as (person ID, sex, birth year,
+    near ancestors or None when relatives may marry), and the IDs of those
+    among them whose spouse search looked outside it"""
+    exclude_relatives = shard.RELATIVE_EXCLUSION_GENERATIONS > 0
+    singles = [
+        (pid, sex, shard.people.birth_year[pid],
+         near_ancestors(shard, pid) if exclude_relatives else None)
+        for sex in ('M', 'F')
+        for pid in shard.find_living_by_birth_year(
+            sex, shard.START_YEAR, year - shard.MARRIAGE_MIN_AGE, year)
+        if not shard.is_married(pid, year)
+    ]
+    proposals = shard.outside_proposals
+    shard.outside_proposals = {}
+    return singles, list(proposals)
+
+
+def emigrate(shard, person_ids, year):
+    """Take people out of a shard as of `year` and return their stored values
+
+    Leaving counts as a death in the shard, so every engine stops simulating
+    them there; their real values are restored when the shards are merged.
+    """
+    leaving = []
+    for pid in person_ids:
+        leaving.append(shard.people.fields(pid))
+        if shard.people.is_deceased[pid]:
+            shard.deaths_by_year[shard.people.death_year[pid]].remove(pid)
+        shard.people.update(pid, {'is_deceased': 1, 'death_year': year - 1,
+                                  'death_month': 12, 'death_day': 31})
+        shard.deaths_by_year.setdefault(year - 1, []).append(pid)
+    return leaving
+
+
+def immigrate(shard, arrivals, year):
+    """Add copies of people from other shards, each marrying a person of this
+    shard in `year`, and return their person IDs
+
+    Arrivals come with the near ancestors they left behind (as keys of
+    FamilySimulation.outside_ancestors), or None when relatives may marry.
+    """
+    person_ids = []
+    for fields, spouse_id, ancestors in arrivals:
+        # The copy has no parents here, the merge restores the original's
+        pid = shard.people.add(**dict(fields, father_id=None, mother_id=None))
+        if ancestors is not None:
+            shard.outside_ancestors[pid] = ancestors
+        shard.index_person(pid)
+        shard.simulate_marriage(spouse_id, pid, year)
+        person_ids.append(pid)
+    return person_ids
+
+
+# Commands sent to the shard workers, each called with the shard and the arguments sent
+SHARD_COMMANDS = {
+    'run': run_shard,
+    'singles': find_singles,
+    'emigrate': emigrate,
+    'immigrate': immigrate,
+}
+
+
+def _shard_worker(conn, shard_args):
+    """Worker: own one shard and run the commands sent by build_population_parallel"""
+    shard = _create_shard(*shard_args)
+    while True:
+        command, args = conn.recv()
+        if command == 'finish':
+            break
+        conn.send(SHARD_COMMANDS[command](shard, *args))
+    # Fill the attributes here too, so that pass runs in parallel as well
+    shard.fill_attributes()
+    conn.send((shard.people, shard.marriages, shard.children_map))
+    conn.close()
+
+
+def global_ancestors(sim, shard, depths, origins, lineage):
+    """Near ancestors of a shard's person (as returned by near_ancestors) as
+    (shard, person ID) keys of the people they originally were
+
+    `origins` maps the (shard, person ID) of copies of moved people to the
+    original's key, and `lineage` maps those keys to the global near
+    ancestors of the moved people, which stayed in the shards they left.
+    """
+    ancestors = {}
+    for pid, depth in depths.items():
+        key = origins.get((shard, pid), (shard, pid))
+        for ancestor, up in lineage.get(key, {key: 0}).items():
+            if depth + up <= sim.RELATIVE_EXCLUSION_GENERATIONS and (
+                    depth + up < ancestors.get(ancestor, depth + up + 1)):
+                ancestors[ancestor] = depth + up
+    return ancestors
+
+
+def local_ancestors(lineage, origins, person, shard):
+    """Global near ancestors of a moved person (None without them), with the
+    keys of people of `shard` turned into their person IDs there"""
+    ancestors = lineage.get(origins.get(person, person))
+    if ancestors is None:
+        return None
+    return {key[1] if key[0] == shard else key: depth for key, depth in ancestors.items()}
+
+
+def match_across_shards(sim, markets, year, origins=None, lineage=None):
+    """Pair people whose spouse search looked outside their shard with
+    unmarried adults of other shards, who marry in `year`
+
+    `markets` holds the output of find_singles for each shard. Close
+    relatives are not paired (with RELATIVE_EXCLUSION_GENERATIONS), telling
+    moved people apart with `origins` and `lineage` (see global_ancestors);
+    the near ancestors of the brides are added to `lineage`, as they move.
+    Returns (husband's shard, husband, wife's shard, wife) tuples.
+    """
+    origins = {} if origins is None else origins
+    lineage = {} if lineage is None else lineage
+    # Those searching are off the market, as they would have married when they searched
+    index = {'M': {}, 'F': {}}  # Maps sex -> birth year -> (shard, person ID) of candidates
+    searching = {}  # Maps (shard, person ID) of those searching to their sex and birth year
+    near = {}  # Maps (shard, person ID) of everyone to their near ancestors, if shipped
+    for shard, (singles, proposals) in enumerate(markets):
+        proposals = set(proposals)
+        for pid, sex, birth_year, depths in singles:
+            near[shard, pid] = depths
+            if pid in proposals:
+                searching[shard, pid] = sex, birth_year
+            else:
+                index[sex].setdefault(birth_year, {})[shard, pid] = None
+    ancestors = {}  # Global near ancestors of the people checked so far
+
+    def relatives(person1, person2):
+        for person in (person1, person2):
+            if person not in ancestors:
+                ancestors[person] = global_ancestors(sim, person[0], near[person], origins, lineage)
+        return not ancestors[person1].keys().isdisjoint(ancestors[person2])
+
+    matches = []
+    max_age_diff = sim.max_spouse_age_gap(year)
+    for shard, (_, proposals) in enumerate(markets):
+        for pid in proposals:
+            # Whoever died since their search is left out
+            if (shard, pid) not in searching:
+                continue
+            sex, birth_year = searching[shard, pid]
+
+            other_sex = 'F' if sex == 'M' else 'M'
+            buckets = index[other_sex]
+            candidates = [
+                (candidate_birth_year, candidate)
+                for candidate_birth_year in range(
+                    birth_year - max_age_diff,
+                    min(birth_year + max_age_diff, year - sim.MARRIAGE_MIN_AGE) + 1)
+                for candidate in buckets.get(candidate_birth_year, ())
+                if candidate[0] != shard and not (
+                    near[shard, pid] is not None and relatives((shard, pid), candidate))
+            ]
+            if not candidates:
+                continue
+
+            partner_birth_year, partner = sim.rng.choice(candidates)
+            del buckets[partner_birth_year][partner]
+            match = (shard, pid, *partner) if sex == 'M' else (*partner, shard, pid)
+            wife = match[2:]
+            if near[wife] is not None:
+                # Her ancestors stay behind in her shard
+                lineage.setdefault(origins.get(wife, wife),
+                                   global_ancestors(sim, wife[0], near[wife], origins, lineage))
+            matches.append(match)
+    return matches
+
+
+def merge_shards(sim, shards, moves):
+    """Append the simulated shards to a simulation, renumbering their people
+
+    `moves` lists the (home shard, person ID, new shard, copy's person ID)
+    of people who moved between shards, in order. Copies are not appended:
+    references to them point to the original person, who takes the values
+    the copy ended up with (name changes, real date of death).
+    """
+    copies = [set() for _ in shards]
+    for _, _, shard, pid in moves:
+        copies[shard].add(pid)
+
+    # Merged IDs of the people kept, then of the copies (which may move again)
+    first_id = len(sim.people)
+    ids, rows = [], []
+    next_id = first_id
+    for (people, _, _), shard_copies in zip(shards, copies):
+        shard_rows = [pid for pid in range(len(people)) if pid not in shard_copies]
+        ids.append(dict(zip(shard_rows, range(next_id, next_id + len(shard_rows)))))
+        rows.append(shard_rows)
+        next_id += len(shard_rows)
+    for home, home_id, shard, pid in moves:
+        ids[shard][pid] = ids[home][home_id]
+
+    for (people, _, _), shard_rows, shard_ids in zip(shards, rows, ids):
+        sim.people.extend(people, shard_rows, shard_ids)
+    for _, _, shard, pid in moves:
+        fields = shards[shard][0].fields(pid)
+        del fields['father_id'], fields['mother_id']
+        sim.people.update(ids[shard][pid], fields)
+
+    for (_, marriages, children_map), shard_ids in zip(shards, ids):
+        for marriage in marriages:
+            sim.register_marriage(dict(
+                marriage,
+                person1_id=shard_ids[marriage['person1_id']],
+                person2_id=shard_ids[marriage['person2_id']]))
+        for parent_id, child_ids in children_map.items():
+            sim.children_map.setdefault(shard_ids[parent_id], []).extend(
+                shard_ids[child_id] for child_id in child_ids)
+    for pid in range(first_id, len(sim.people)):
+        sim.index_person(pid)
+
+
+def build_population_parallel(sim, num_families=15, num_generations=4, engine='classic',
+                              workers=None, attribute_pool_size=None):
+    """Generate a simulation's population shard by shard in worker processes
+
+    Shards use attribute pools of `attribute_pool_size` values, by default
+    the simulation's pool size (the simulation itself needs no pools).
+    """
+    workers = workers or multiprocessing.cpu_count()
+    num_shards = max(1, min(workers, num_families))
+    attribute_pool_size = attribute_pool_size or sim.attribute_pool_size
+
+    # Spread the families (and the target population) over the shards and give
+    # each shard its own seed and attribute seed (drawn from the simulation's
+    # attribute seed in shard order), with the simulation's settings
+    base_size, extra = divmod(num_families, num_shards)
+    shard_target = -(-sim.target_population // num_shards) if sim.target_population else None
+    settings = {name.lower(): value for name, value in vars(sim).items() if name.isupper()}
+    attribute_rng = random.Random(sim.attribute_seed)
+    shard_args = [
+        (base_size + (1 if shard < extra else 0), num_generations, sim.rng.getrandbits(64),
+         attribute_pool_size, attribute_rng.getrandbits(64), sim.lazy_attributes,
+         sim.batch_attributes, shard_target, settings)
+        for shard in range(num_shards)
+    ]
+
+    print(f"Simulating {num_families} families in {num_shards} shards on {workers} workers...")
+    print(f"Shard seeds: {', '.join(str(args[2]) for args in shard_args)}")
+    if attribute_pool_size or sim.lazy_attributes:
+        print(f"Shard attribute seeds: {', '.join(str(args[4]) for args in shard_args)}")
+    connections, processes = [], []
+    for args in shard_args:
+        conn, worker_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_shard_worker, args=(worker_conn, args))
+        process.start()
+        worker_conn.close()
+        connections.append(conn)
+        processes.append(process)
+
+    def call(command, shard_args):
+        """Send a command to the given shards at once and collect their replies"""
+        for shard, args in shard_args.items():
+            connections[shard].send((command, args))
+        return {shard: connections[shard].recv() for shard in shard_args}
+
+    running = set(range(num_shards))  # Shards whose simulation has not ended
+    moves = []
+    origins, lineage = {}, {}  # Who the copies of moved people are, see global_ancestors
+    year = sim.START_YEAR + 20
+    while running:
+        # Each shard holds about an equal share of the population of the running shards
+        outside_share = 1 - 1 / len(running)
+        year = min(year + EPOCH_YEARS, sim.CURRENT_YEAR)
+        paused = call('run', {shard: (num_generations, engine, year, outside_share)
+                              for shard in sorted(running)})
+        simulated, running = running, {shard for shard in running if paused[shard]}
+        if len(simulated) < 2:
+            continue
+
+        # Marriages across the shards just simulated (in the last simulated year once
+        # they all ended), the bride moves to her husband's shard
+        market_year = min(year, sim.CURRENT_YEAR - 1)
+        markets = call('singles', {shard: (market_year,) for shard in sorted(simulated)})
+        matches = match_across_shards(
+            sim, [markets.get(shard, ([], [])) for shard in range(num_shards)], market_year,
+            origins, lineage)
+        leaving, arrivals = {}, {}
+        for husband_shard, husband, wife_shard, wife in matches:
+            leaving.setdefault(wife_shard, []).append(wife)
+            arrivals.setdefault(husband_shard, []).append((husband, wife_shard, wife))
+        left = call('emigrate', {shard: (person_ids, market_year)
+                                 for shard, person_ids in leaving.items()})
+        fields = {(shard, pid): values for shard, person_ids in leaving.items()
+                  for pid, values in zip(person_ids, left[shard])}
+        arrived = call('immigrate', {
+            shard: ([(fields[wife_shard, wife], husband,
+                      local_ancestors(lineage, origins, (wife_shard, wife), shard))
+                     for husband, wife_shard, wife in shard_arrivals], market_year)
+            for shard, shard_arrivals in arrivals.items()})
+        for shard, shard_arrivals in arrivals.items():
+            for (_, wife_shard, wife), pid in zip(shard_arrivals, arrived[shard]):
+                moves.append((wife_shard, wife, shard, pid))
+                origins[shard, pid] = origins.get((wife_shard, wife), (wife_shard, wife))
+
+    for conn in connections:
+        conn.send(('finish', ()))
+    shards = [conn.recv() for conn in connections]
+    for process in processes:
+        process.join()
+
+    merge_shards(sim, shards, moves)
+    print(f"Merged {len(sim.people)} people, with {len(moves)} marriages across shards")
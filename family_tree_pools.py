@@ -0,0 +1,61 @@
+"""
+Pre-generated Faker attribute pools for the family tree generator.
+
+Live Faker calls for cities, countries, addresses and jobs dominate the cost of
+creating a person. AttributePools generates a bounded pool of each up front
+with a seeded Faker and then draws values by index, so values repeat across
+people but generation no longer waits on Faker. Pools are cached per process
+by size and seed, so many simulations can share them.
+"""
+
+import random
+from faker import Faker
+
+_pools = {}  # Maps (size, seed) to the generated value lists
+
+
+def generate_pools(size, seed):
+    """Lists of `size` cities, countries, addresses and jobs from a Faker seeded with `seed`"""
+    if (size, seed) not in _pools:
+        fake = Faker()
+        fake.seed_instance(seed)
+        _pools[size, seed] = {
+            'city': [fake.city() for _ in range(size)],
+            'country': [fake.country() for _ in range(size)],
+            'address': [fake.address() for _ in range(size)],
+            'job': [fake.job() for _ in range(size)],
+        }
+    return _pools[size, seed]
+
+
+class AttributePools:
+    """Stand-in for the Faker calls of the generator, drawing from pre-generated pools
+
+    Draws use their own RNG seeded like the pools, so the simulation's random
+    stream is the same as with live Faker calls.
+    """
+
+    def __init__(self, size, seed):
+        self.size = size
+        self.seed = seed
+        self.random = random.Random(seed)  # Named like Faker's, for checkpoints
+        pools = generate_pools(size, seed)
+        self.cities = pools['city']
+        self.countries = pools['country']
+        self.addresses = pools['address']
+        self.jobs = pools['job']
+
+    def _draw(self, pool):
+        return pool[int(self.random.random() * self.size)]
+
+    def city(self):
+        return self._draw(self.cities)
+
+    def country(self):
+        return self._draw(self.countries)
+
+    def address(self):
+        return self._draw(self.addresses)
+
+    def job(self):
+        return self._draw(self.jobs)
@@ -0,0 +1,83 @@
+"""
+Per-phase profiling of the yearly simulation loop.
+
+PhaseProfiler records, for each simulated year, the wall time, number of calls
+and number of people or marriages handled by each phase of the loop, and the
+time spent in Faker and name calls (which is also part of the phase making
+them). The timeline is saved as JSON, one entry per year:
+
+    [{"year": 1920, "population": 130,
+      "phases": {"eligibility": {"seconds": 0.0004, "calls": 1, "size": 130}, ...}},
+     ...]
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+
+class PhaseProfiler:
+    """Timeline of per-phase timings, one entry per simulated year"""
+
+    def __init__(self):
+        self.timeline = []
+        self.current = None  # Entry of the year being simulated, None between runs
+
+    def start_year(self, year, population):
+        self.current = {'year': year, 'population': population, 'phases': {}}
+        self.timeline.append(self.current)
+
+    def stop(self):
+        self.current = None
+
+    def record(self, name, seconds, size=None):
+        """Add a call of a phase to the current year; ignored outside the yearly loop"""
+        if self.current is None:
+            return
+        phase = self.current['phases'].setdefault(name, {'seconds': 0.0, 'calls': 0})
+        phase['seconds'] += seconds
+        phase['calls'] += 1
+        if size is not None:
+            phase['size'] = phase.get('size', 0) + size
+
+    @contextmanager
+    def phase(self, name, size=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, size)
+
+    def totals(self):
+        """Total seconds per phase over the whole timeline, slowest first"""
+        totals = {}
+        for entry in self.timeline:
+            for name, phase in entry['phases'].items():
+                totals[name] = totals.get(name, 0.0) + phase['seconds']
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.timeline, f, indent=2)
+
+
+class TimedSource:
+    """Proxy recording the method calls of a Faker instance or name source as a phase"""
+
+    def __init__(self, source, profiler, name):
+        self.source = source
+        self.profiler = profiler
+        self.name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self.source, attr)
+        if not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self.profiler.record(self.name, time.perf_counter() - start)
+        return timed
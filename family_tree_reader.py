@@ -0,0 +1,107 @@
+"""
+Streaming input of generated family trees.
+
+The counterpart of family_tree_writer: records are parsed one at a time from
+a JSON file ({"people": [...], "marriages": [...]}) or an NDJSON file, read
+in fixed-size chunks, so memory use does not grow with the size of the tree.
+Compressed files (.gz, .zst) are read the same way.
+"""
+
+import json
+
+from family_tree_writer import open_text, is_ndjson
+
+READ_SIZE = 1 << 16  # Characters read from the file at a time
+WHITESPACE = ' \t\n\r'
+
+# Record kinds of the arrays of a JSON tree
+ARRAY_KINDS = {'people': 'person', 'marriages': 'marriage'}
+
+
+class _ChunkedParser:
+    """Decodes consecutive JSON values from a text file without reading it whole"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        data = self.f.read(READ_SIZE)
+        if not data:
+            self.eof = True
+        # Drop what has been parsed, so the buffer stays about one chunk long
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        """Next non-whitespace character, '' at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                return ''
+            self.fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} of the JSON input")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next value, reading more of the file until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+            # A number or literal cut off by the end of the buffer decodes too early
+            if end == len(self.buffer) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_records(f):
+    """(kind, record) pairs of the arrays of a JSON tree, parsed incrementally
+
+    Top-level values other than the people and marriages arrays are skipped.
+    """
+    parser = _ChunkedParser(f)
+    parser.expect('{')
+    while parser.peek() != '}':
+        key = parser.value()
+        parser.expect(':')
+        if key in ARRAY_KINDS and parser.peek() == '[':
+            parser.expect('[')
+            while parser.peek() != ']':
+                yield ARRAY_KINDS[key], parser.value()
+                if parser.peek() == ',':
+                    parser.expect(',')
+            parser.expect(']')
+        else:
+            parser.value()
+        if parser.peek() == ',':
+            parser.expect(',')
+
+
+def iter_records(path):
+    """(kind, record) pairs of a JSON or NDJSON tree, kind being 'person' or 'marriage'"""
+    with open_text(path) as f:
+        if not is_ndjson(path):
+            yield from iter_json_records(f)
+            return
+
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record.pop('type', 'person'), record
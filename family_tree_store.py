@@ -0,0 +1,270 @@
+"""
+Compact column store for the people created by the family tree generator.
+
+People are identified by dense integer IDs (their position in the store).
+Dates are kept as integer year/month/day columns and categorical fields are
+dictionary-encoded, so the exported form (string IDs, ISO dates) is only
+produced when records are written out.
+"""
+
+from array import array
+
+NO_PERSON = -1  # Stored in father_id/mother_id when a parent is unknown
+
+# Integer columns and their array typecodes
+INT_COLUMNS = {
+    'birth_year': 'h',
+    'birth_month': 'B',
+    'birth_day': 'B',
+    'death_year': 'h',  # 0 while there is no date of death
+    'death_month': 'B',
+    'death_day': 'B',
+    'is_deceased': 'B',
+    'height_cm': 'H',
+    'has_legacy_bucket': 'B',
+    'has_attributes': 'B',  # 0 until the non-structural attributes are drawn
+    'is_evicted': 'B',  # 1 once the text fields have been moved to a PersonArchive
+    'generation': 'H',  # 1 for founders, one more than their parents' for children
+    'father_id': 'i',
+    'mother_id': 'i',
+}
+
+# Dictionary-encoded columns; columns listed together share one vocabulary
+CATEGORY_COLUMNS = [
+    ('first_name', 'middle_name', 'last_name', 'maiden_name'),
+    ('sex',),
+    ('blood_type',),
+    ('nationality',),
+    ('ethnicity',),
+    ('cause_of_death',),
+    ('eye_color',),
+    ('hair_color',),
+    ('occupation',),
+    ('education',),
+    ('religion',),
+    ('notes',),
+]
+
+# Free text columns, kept as plain lists (place of birth is near unique per person,
+# so a vocabulary would only duplicate it)
+TEXT_COLUMNS = ['email', 'phone', 'address', 'place_of_birth']
+
+COLUMN_NAMES = [*INT_COLUMNS, *(name for names in CATEGORY_COLUMNS for name in names),
+                *TEXT_COLUMNS]
+
+
+def format_date(year, month, day):
+    """Format integer date parts as an ISO date string"""
+    return f"{year}-{month:02d}-{day:02d}"
+
+
+def parse_date(date):
+    """Integer (year, month, day) of an ISO date string, zeros for None"""
+    if not date:
+        return 0, 0, 0
+    year, month, day = date.split('-')
+    return int(year), int(month), int(day)
+
+
+class Vocabulary:
+    """Dictionary encoding of categorical values, code 0 is reserved for None"""
+
+    def __init__(self):
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class CategoryColumn:
+    """Column of dictionary-encoded values, read and written as plain values"""
+
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+        self.codes = array('B')
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.vocabulary.values[self.codes[index]]
+
+    def __setitem__(self, index, value):
+        code = self._encode(value)
+        self.codes[index] = code
+
+    def append(self, value):
+        code = self._encode(value)
+        self.codes.append(code)
+
+    def extend(self, other, rows=None):
+        """Append all values (or those at `rows`) of a column that may use a
+        different vocabulary"""
+        recode = [self._encode(value) for value in other.vocabulary.values]
+        if rows is None:
+            self.codes.extend(recode[code] for code in other.codes)
+        else:
+            self.codes.extend(recode[other.codes[row]] for row in rows)
+
+    def count(self, value):
+        """Number of entries holding the given value"""
+        code = self.vocabulary.codes.get(value)
+        return 0 if code is None else self.codes.count(code)
+
+    def encode_all(self, values):
+        """Codes of the given values, so codes can be written to the column directly"""
+        return [self._encode(value) for value in values]
+
+    def _encode(self, value):
+        code = self.vocabulary.encode(value)
+        # Start with one byte per value and widen once the vocabulary outgrows it
+        if code > 0xFF and self.codes.typecode == 'B':
+            self.codes = array('I', self.codes)
+        return code
+
+
+class PersonStore:
+    """Column-oriented storage for people, indexed by dense integer IDs"""
+
+    def __init__(self):
+        for name, typecode in INT_COLUMNS.items():
+            setattr(self, name, array(typecode))
+        for names in CATEGORY_COLUMNS:
+            vocabulary = Vocabulary()
+            for name in names:
+                setattr(self, name, CategoryColumn(vocabulary))
+        for name in TEXT_COLUMNS:
+            setattr(self, name, [])
+
+    def __len__(self):
+        return len(self.birth_year)
+
+    def __contains__(self, person_id):
+        return person_id is not None and 0 <= person_id < len(self.birth_year)
+
+    def add(self, **fields):
+        """Append a person and return their ID; missing fields are left empty"""
+        person_id = len(self.birth_year)
+        for name in ('father_id', 'mother_id'):
+            if fields.get(name) is None:
+                fields[name] = NO_PERSON
+
+        for name in INT_COLUMNS:
+            getattr(self, name).append(fields.get(name) or 0)
+        for names in CATEGORY_COLUMNS:
+            for name in names:
+                getattr(self, name).append(fields.get(name))
+        for name in TEXT_COLUMNS:
+            getattr(self, name).append(fields.get(name))
+        return person_id
+
+    def extend(self, other, rows=None, ids=None):
+        """Append the people of another store, shifting their parent IDs to match
+
+        With `rows`, only the people at those positions of the other store are
+        appended, in that order. `ids` maps the other store's person IDs to
+        their IDs in this store, by default the position they are appended at.
+        """
+        offset = len(self)
+        if rows is None and ids is None:
+            for name in INT_COLUMNS:
+                if name in ('father_id', 'mother_id'):
+                    getattr(self, name).extend(
+                        pid + offset if pid != NO_PERSON else NO_PERSON
+                        for pid in getattr(other, name))
+                else:
+                    getattr(self, name).extend(getattr(other, name))
+            for names in CATEGORY_COLUMNS:
+                for name in names:
+                    getattr(self, name).extend(getattr(other, name))
+            for name in TEXT_COLUMNS:
+                getattr(self, name).extend(getattr(other, name))
+            return offset
+
+        if rows is None:
+            rows = range(len(other))
+        if ids is None:
+            ids = dict(zip(rows, range(offset, offset + len(rows))))
+        for name in INT_COLUMNS:
+            column = getattr(other, name)
+            if name in ('father_id', 'mother_id'):
+                getattr(self, name).extend(
+                    ids[column[row]] if column[row] != NO_PERSON else NO_PERSON
+                    for row in rows)
+            else:
+                getattr(self, name).extend(column[row] for row in rows)
+        for names in CATEGORY_COLUMNS:
+            for name in names:
+                getattr(self, name).extend(getattr(other, name), rows)
+        for name in TEXT_COLUMNS:
+            column = getattr(other, name)
+            getattr(self, name).extend(column[row] for row in rows)
+        return offset
+
+    def fields(self, person_id):
+        """All stored values of a person, by column name (as taken by add)"""
+        return {name: getattr(self, name)[person_id] for name in COLUMN_NAMES}
+
+    def update(self, person_id, fields):
+        """Overwrite stored values of a person, by column name"""
+        for name, value in fields.items():
+            getattr(self, name)[person_id] = value
+
+    def take_text(self, person_id):
+        """Clear the free text fields of a person and return their values"""
+        values = tuple(getattr(self, name)[person_id] for name in TEXT_COLUMNS)
+        for name in TEXT_COLUMNS:
+            getattr(self, name)[person_id] = None
+        return values
+
+    def date_of_birth(self, person_id):
+        return format_date(self.birth_year[person_id], self.birth_month[person_id],
+                           self.birth_day[person_id])
+
+    def date_of_death(self, person_id):
+        if not self.death_year[person_id]:
+            return None
+        return format_date(self.death_year[person_id], self.death_month[person_id],
+                           self.death_day[person_id])
+
+    def to_dict(self, person_id, ids, legacy_bucket_id=None):
+        """Build the exported record of a person
+
+        `ids` maps integer person IDs to their exported IDs.
+        """
+        father_id = self.father_id[person_id]
+        mother_id = self.mother_id[person_id]
+        return {
+            "id": ids[person_id],
+            "first_name": self.first_name[person_id],
+            "middle_name": self.middle_name[person_id],
+            "last_name": self.last_name[person_id],
+            "maiden_name": self.maiden_name[person_id],
+            "date_of_birth": self.date_of_birth(person_id),
+            "sex": self.sex[person_id],
+            "blood_type": self.blood_type[person_id],
+            "nationality": self.nationality[person_id],
+            "ethnicity": self.ethnicity[person_id],
+            "place_of_birth": self.place_of_birth[person_id],
+            "date_of_death": self.date_of_death(person_id),
+            "is_deceased": bool(self.is_deceased[person_id]),
+            "cause_of_death": self.cause_of_death[person_id],
+            "height_cm": self.height_cm[person_id],
+            "eye_color": self.eye_color[person_id],
+            "hair_color": self.hair_color[person_id],
+            "email": self.email[person_id],
+            "phone": self.phone[person_id],
+            "address": self.address[person_id],
+            "occupation": self.occupation[person_id],
+            "education": self.education[person_id],
+            "religion": self.religion[person_id],
+            "notes": self.notes[person_id],
+            "legacy_bucket_id": legacy_bucket_id,
+            "father_id": ids[father_id] if father_id != NO_PERSON else None,
+            "mother_id": ids[mother_id] if mother_id != NO_PERSON else None
+        }
@@ -14,7 +14,9 @@ from datetime import datetime
 # We're using exec() to avoid import errors if you run this directly
 try:
     # First, try direct import
-    from family_tree_generator import create_family_tree
+    from family_tree_generator import create_family_tree, FamilySimulation
+    from family_tree_ids import ID_SCHEMES, detect_id_scheme
+    from family_tree_reader import iter_records
     # from family_tree_visualizer import run_visualization
     from sql_import_exporter import process_family_data
 except ImportError:
@@ -47,23 +49,64 @@ def create_output_directory(base_dir='family_tree_output'):
     return output_dir
 
 
-def simplified_workflow(output_dir, num_families=15, num_generations=4):
-    """Run a simplified workflow focusing only on the interactive visualization"""
+def simplified_workflow(output_dir, num_families=15, num_generations=4, engine='classic',
+                        workers=1, attribute_pool_size=None, attribute_seed=None,
+                        lazy_attributes=False, batch_attributes=False, compact=None,
+                        checkpoint_interval=10, resume=False, target_population=None,
+                        id_scheme=None, profile=False, evict=False, closure=False, sync=False):
+    """Run a simplified workflow focusing only on the interactive visualization
+
+    `id_scheme` defaults to uuid4, or with `resume` to the scheme of the run
+    being continued. With `sync`, no tree is generated (unless `resume`
+    continues a run): the family_tree.json already in `output_dir`, such as
+    one extended by family_tree_incremental.py --full, is used and the
+    database there is updated with only the rows that changed.
+    """
     print("=" * 80)
     print(f"SIMPLIFIED FAMILY TREE WORKFLOW")
     print(f"Output directory: {output_dir}")
     print("=" * 80)
 
-    # Step 1: Generate the family tree data
-    print("\n[Step 1/3] Generating family tree data...")
     json_path = os.path.join(output_dir, 'family_tree.json')
-    create_family_tree(output_file=json_path,
-                       num_families=num_families, num_generations=num_generations)
+    if sync and not resume:
+        # Step 1: The tree was updated in place, the database only catches up with it
+        print(f"\n[Step 1/3] Using the family tree data in {json_path}...")
+        first_person = next((record for kind, record in iter_records(json_path)
+                             if kind == 'person'), None)
+        id_scheme = (detect_id_scheme(first_person['id']) if first_person else None) or 'uuid4'
+    else:
+        # Step 1: Generate the family tree data
+        print("\n[Step 1/3] Generating family tree data...")
+        checkpoint_path = os.path.join(output_dir, 'simulation.checkpoint')
+        # Continue from the last snapshot of an interrupted run in the same directory
+        simulation = FamilySimulation.load_checkpoint(checkpoint_path) if resume else None
+        if simulation:
+            # The resumed run keeps its IDs, and the database must store them the same way
+            if id_scheme and id_scheme != simulation.id_scheme:
+                print(f"Warning: ignoring ID scheme '{id_scheme}', the resumed run uses "
+                      f"'{simulation.id_scheme}'")
+            id_scheme = simulation.id_scheme
+        else:
+            id_scheme = id_scheme or 'uuid4'
+        create_family_tree(output_file=json_path, simulation=simulation,
+                           num_families=num_families, num_generations=num_generations,
+                           engine=engine, workers=workers,
+                           attribute_pool_size=attribute_pool_size,
+                           attribute_seed=attribute_seed, lazy_attributes=lazy_attributes,
+                           batch_attributes=batch_attributes, compact=compact,
+                           checkpoint_path=checkpoint_path,
+                           checkpoint_interval=checkpoint_interval,
+                           target_population=target_population, id_scheme=id_scheme,
+                           profile_path=(os.path.join(output_dir, 'profile.json')
+                                         if profile else None),
+                           evict_path=os.path.join(output_dir, 'evicted.db') if evict else None)
 
     # Step 2: Import into SQLite
-    print("\n[Step 2/3] Creating SQLite database...")
+    print("\n[Step 2/3] Updating the SQLite database..." if sync else
+          "\n[Step 2/3] Creating SQLite database...")
     db_path = os.path.join(output_dir, 'family_tree.db')
-    process_family_data(json_path=json_path, db_path=db_path)
+    process_family_data(json_path=json_path, db_path=db_path,
+                        integer_ids=id_scheme == 'integer', closure=closure, sync=sync)
 
     # Step 3: Generate only the interactive visualization
     print("\n[Step 3/3] Creating interactive visualization...")
@@ -123,11 +166,69 @@ if __name__ == "__main__":
     parser.add_argument('--families', type=int, default=4,
                         help='Number of initial families to create')
     parser.add_argument('--generations', type=int, default=4,
-                        help='Number of generations to simulate')
+                        help='Number of generations to simulate (founders are the first); '
+                             'the simulation stops early once no lineage can continue')
+    parser.add_argument('--target-population', type=int,
+                        help='Stop the simulation once this many people have been created')
     parser.add_argument('--output-dir', type=str,
                         help='Output directory (defaults to timestamped directory)')
+    parser.add_argument('--engine', choices=['classic', 'numpy', 'events'], default='classic',
+                        help='Simulation engine (numpy runs each yearly phase as a batch, '
+                             'events only processes scheduled state changes)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes to simulate independent family lines in parallel')
+    parser.add_argument('--attribute-pool-size', type=int,
+                        help='Draw cities, countries, addresses and jobs from pre-generated '
+                             'pools of this size instead of calling Faker for every person')
+    parser.add_argument('--attribute-seed', type=int,
+                        help='Seed of the attribute pools and lazy attributes '
+                             '(printed when not given)')
+    parser.add_argument('--lazy-attributes', action='store_true',
+                        help='Simulate the family structure first and draw the other '
+                             'attributes in a separate pass (run by the workers with --workers)')
+    parser.add_argument('--batch-attributes', action='store_true',
+                        help='Draw the lazy attributes of everyone at once with NumPy '
+                             '(requires --lazy-attributes and --attribute-pool-size)')
+    parser.add_argument('--compact', action='store_const', const=True,
+                        help='Write the JSON without indentation (the default above 100000 people)')
+    parser.add_argument('--checkpoint-interval', type=int, default=10,
+                        help='Simulated years between snapshots of the simulation state, '
+                             'saved in the output directory (classic engine, 0 for none)')
+    parser.add_argument('--id-scheme', choices=ID_SCHEMES,
+                        help='IDs of people and legacy buckets: random UUIDs (the default), '
+                             'time-ordered UUIDs or dense integers (stored as the database '
+                             'row IDs); --resume keeps the scheme of the run')
+    parser.add_argument('--profile', action='store_true',
+                        help='Save the time spent in each phase of every simulated year '
+                             'to profile.json in the output directory (classic engine)')
+    parser.add_argument('--evict', action='store_true',
+                        help='Move the text fields of people who died (unless drawn later by '
+                             '--lazy-attributes) and ended marriages to evicted.db in the '
+                             'output directory during the simulation; fixed-width columns '
+                             'stay in memory for everyone')
+    parser.add_argument('--closure', action='store_true',
+                        help='Add an ancestor-descendant closure table to the database, '
+                             'so lineage queries are single index lookups')
+    parser.add_argument('--sync', action='store_true',
+                        help='Update the database in --output-dir from the family_tree.json '
+                             'there (e.g. extended by family_tree_incremental.py --full) with '
+                             'only the people and marriages that changed, without generating '
+                             'a tree (with --resume, from the resumed run\'s tree)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the interrupted run in --output-dir from its last snapshot')
 
     args = parser.parse_args()
+    if args.resume and not args.output_dir:
+        parser.error('--resume requires the --output-dir of the run to continue')
+    if args.batch_attributes and not (args.lazy_attributes and args.attribute_pool_size):
+        parser.error('--batch-attributes requires --lazy-attributes and --attribute-pool-size')
+    if args.sync and not args.output_dir:
+        parser.error('--sync requires the --output-dir of the tree to sync')
+    if args.sync and not args.resume and not os.path.exists(
+            os.path.join(args.output_dir, 'family_tree.json')):
+        parser.error(f'--sync found no family_tree.json in {args.output_dir}')
+    if args.checkpoint_interval < 0:
+        parser.error('--checkpoint-interval must be 0 (no snapshots) or a number of years')
 
     # Create output directory if not specified
     output_dir = args.output_dir if args.output_dir else create_output_directory()
@@ -136,7 +237,22 @@ if __name__ == "__main__":
     results = simplified_workflow(
         output_dir=output_dir,
         num_families=args.families,
-        num_generations=args.generations
+        num_generations=args.generations,
+        engine=args.engine,
+        workers=args.workers,
+        attribute_pool_size=args.attribute_pool_size,
+        attribute_seed=args.attribute_seed,
+        lazy_attributes=args.lazy_attributes,
+        batch_attributes=args.batch_attributes,
+        compact=args.compact,
+        checkpoint_interval=args.checkpoint_interval,
+        resume=args.resume,
+        target_population=args.target_population,
+        id_scheme=args.id_scheme,
+        profile=args.profile,
+        evict=args.evict,
+        closure=args.closure,
+        sync=args.sync
     )
 
     if results:
@@ -0,0 +1,115 @@
+"""
+Streaming output of generated family trees.
+
+Records are serialized one at a time and written in chunks, so the exported
+tree never has to be held in memory as a whole. Two layouts are supported:
+
+- JSON: {"people": [...], "marriages": [...]}, indented or compact
+- NDJSON: one object per line, each with a "type" of "person" or "marriage"
+
+Files ending in .gz are gzip-compressed, files ending in .zst are
+zstd-compressed (requires the zstandard package).
+"""
+
+import gzip
+import json
+try:
+    import zstandard
+    HAVE_ZSTD = True
+except ImportError:
+    HAVE_ZSTD = False
+
+CHUNK_SIZE = 1000  # Records serialized per write
+COMPACT_THRESHOLD = 100000  # Above this many people, JSON output is compact by default
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+
+
+def open_text(path, mode='r'):
+    """Open a text file, compressed according to its extension"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if path.endswith('.zst'):
+        if not HAVE_ZSTD:
+            raise ImportError(
+                "zstd compression requires zstandard. Install with: pip install zstandard")
+        return zstandard.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def is_ndjson(path):
+    """Whether a file name (compression suffix aside) asks for NDJSON"""
+    for suffix in ('.gz', '.zst'):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)]
+    return path.endswith(NDJSON_SUFFIXES)
+
+
+def _write_records(f, records, encode, separator):
+    """Write encoded records joined by `separator`, a chunk at a time
+
+    Returns whether any record was written.
+    """
+    written = False
+    chunk = []
+    for record in records:
+        chunk.append(encode(record))
+        if len(chunk) == CHUNK_SIZE:
+            f.write((separator if written else '') + separator.join(chunk))
+            written = True
+            chunk = []
+    if chunk:
+        f.write((separator if written else '') + separator.join(chunk))
+        written = True
+    return written
+
+
+def write_ndjson(f, people, marriages):
+    """Write person and marriage records as newline-delimited JSON"""
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    for kind, records in (('person', people), ('marriage', marriages)):
+        _write_records(f, records, lambda record: dumps({'type': kind, **record}) + '\n', '')
+
+
+def write_json(f, people, marriages, indent=None):
+    """Write {"people": [...], "marriages": [...]} without building it in memory
+
+    The output is the same as json.dump(..., indent=indent) would produce.
+    """
+    if indent is None:
+        dumps = json.JSONEncoder(separators=(',', ':')).encode
+        f.write('{"people":[')
+        _write_records(f, people, dumps, ',')
+        f.write('],"marriages":[')
+        _write_records(f, marriages, dumps, ',')
+        f.write(']}')
+        return
+
+    dumps = json.JSONEncoder(indent=indent).encode
+    pad = ' ' * indent
+    item_pad = '\n' + pad * 2
+
+    def encode(record):
+        return item_pad + dumps(record).replace('\n', item_pad)
+
+    f.write('{')
+    for key, records, closing in (('people', people, ','), ('marriages', marriages, '')):
+        f.write(f'\n{pad}"{key}": [')
+        if _write_records(f, records, encode, ','):
+            f.write(f'\n{pad}')
+        f.write(']' + closing)
+    f.write('\n}')
+
+
+def write_family_tree(output_file, people, marriages, num_people, compact=None):
+    """Stream people and marriage records to a JSON or NDJSON file
+
+    `compact` defaults to True for runs of more than COMPACT_THRESHOLD people.
+    """
+    if compact is None:
+        compact = num_people > COMPACT_THRESHOLD
+
+    with open_text(output_file, 'w') as f:
+        if is_ndjson(output_file):
+            write_ndjson(f, people, marriages)
+        else:
+            write_json(f, people, marriages, indent=None if compact else 2)
@@ -1,17 +1,59 @@
-import json
+import hashlib
 import sqlite3
 import os
-
-
-def create_database_schema(db_path):
-    """Create SQLite database with the Person table schema"""
+import time
+
+from family_tree_reader import iter_records
+from family_tree_writer import write_family_tree
+
+BATCH_SIZE = 10000  # Rows per executemany call when importing
+
+PERSON_COLUMNS = [
+    'id', 'first_name', 'middle_name', 'last_name', 'maiden_name',
+    'date_of_birth', 'sex', 'blood_type', 'nationality', 'ethnicity',
+    'place_of_birth', 'date_of_death', 'is_deceased', 'cause_of_death',
+    'height_cm', 'eye_color', 'hair_color', 'email', 'phone',
+    'address', 'occupation', 'education', 'religion', 'notes',
+    'legacy_bucket_id', 'father_id', 'mother_id'
+]
+IS_DECEASED_COLUMN = PERSON_COLUMNS.index('is_deceased')
+# Columns written by import_from_json: the exported fields and a content hash
+PERSON_ROW_COLUMNS = PERSON_COLUMNS + ['row_hash']
+MARRIAGE_COLUMNS = ['person1_id', 'person2_id', 'year', 'is_current']
+PARENT_CHILD_COLUMNS = ['parent_id', 'child_id', 'role']
+
+
+def create_database_schema(db_path, integer_ids=False, indexes=True, closure=False):
+    """Create SQLite database with the Person, Marriage and ParentChild tables
+
+    ParentChild holds one row per known parent of a person (the father_id and
+    mother_id links as edges), clustered by parent so children are found by
+    an index range scan.
+
+    row_hash is a hash of the other imported columns, so sync_from_json can
+    tell changed people from unchanged ones without reading their rows.
+    birth_year and death_year are generated from the dates, so they stay in
+    step with every insert and upsert; analytics group and filter on them
+    (and on the is_deceased, birth_year index) instead of parsing dates.
+
+    With `integer_ids` (trees generated with the integer ID scheme), person
+    IDs are the table's row IDs, so rows are stored in ID order, and parent
+    references and legacy bucket IDs are plain integers. Without `indexes`, they are left for a
+    bulk import to build once the data is in.
+
+    With `closure`, a PersonClosure table holds every (ancestor, descendant,
+    depth) pair, depth being the fewest generations between them (0 for a
+    person and themselves). A bulk import fills it once the data is in (see
+    build_closure); otherwise triggers keep it in step with each insert.
+    """
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
+    id_type = 'INTEGER' if integer_ids else 'TEXT'
 
     # Create the Person table
-    c.execute('''
+    c.execute(f'''
     CREATE TABLE IF NOT EXISTS Person (
-        id TEXT PRIMARY KEY,
+        id {id_type} PRIMARY KEY,
         first_name TEXT NOT NULL,
         middle_name TEXT,
         last_name TEXT NOT NULL,
@@ -35,65 +77,251 @@ def create_database_schema(db_path):
         education TEXT,
         religion TEXT,
         notes TEXT,
-        legacy_bucket_id TEXT,
-        father_id TEXT,
-        mother_id TEXT,
+        legacy_bucket_id {id_type},
+        father_id {id_type},
+        mother_id {id_type},
+        row_hash INTEGER,
+        birth_year INTEGER GENERATED ALWAYS AS (CAST(substr(date_of_birth, 1, 4) AS INTEGER)),
+        death_year INTEGER GENERATED ALWAYS AS (CAST(substr(date_of_death, 1, 4) AS INTEGER)),
         FOREIGN KEY (father_id) REFERENCES Person(id),
         FOREIGN KEY (mother_id) REFERENCES Person(id)
     )
     ''')
 
-    # Create indexes
+    # Create the Marriage table, a couple marries at most once a year
+    c.execute(f'''
+    CREATE TABLE IF NOT EXISTS Marriage (
+        id INTEGER PRIMARY KEY,
+        person1_id {id_type} NOT NULL,
+        person2_id {id_type} NOT NULL,
+        year INTEGER,
+        is_current INTEGER DEFAULT 1,
+        UNIQUE (person1_id, person2_id, year),
+        FOREIGN KEY (person1_id) REFERENCES Person(id),
+        FOREIGN KEY (person2_id) REFERENCES Person(id)
+    )
+    ''')
+
+    # Create the parent-child edge table
+    c.execute(f'''
+    CREATE TABLE IF NOT EXISTS ParentChild (
+        parent_id {id_type} NOT NULL,
+        child_id {id_type} NOT NULL,
+        role TEXT CHECK (role IN ('father', 'mother')),
+        PRIMARY KEY (parent_id, child_id),
+        FOREIGN KEY (parent_id) REFERENCES Person(id),
+        FOREIGN KEY (child_id) REFERENCES Person(id)
+    ) WITHOUT ROWID
+    ''')
+
+    if closure:
+        c.execute(f'''
+        CREATE TABLE IF NOT EXISTS PersonClosure (
+            ancestor_id {id_type} NOT NULL,
+            descendant_id {id_type} NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (ancestor_id, descendant_id)
+        ) WITHOUT ROWID
+        ''')
+
+    if indexes:
+        create_indexes(c)
+        if closure:
+            create_closure_triggers(c)
+
+    conn.commit()
+    conn.close()
+
+    print(f"Database schema created at {db_path}")
+    return db_path
+
+
+def create_indexes(c):
+    """Create the Person, Marriage and ParentChild indexes (if missing)"""
     c.execute('CREATE INDEX IF NOT EXISTS idx_person_father ON Person(father_id)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_person_mother ON Person(mother_id)')
     c.execute(
         'CREATE INDEX IF NOT EXISTS idx_person_name ON Person(last_name, first_name)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_person_birth ON Person(date_of_birth)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_person_deceased_birth '
+              'ON Person(is_deceased, birth_year)')
     c.execute(
         'CREATE INDEX IF NOT EXISTS idx_legacy_bucket ON Person(legacy_bucket_id)')
+    # Covering indexes: spouses of person2 and parents of a child without table lookups
+    c.execute('CREATE INDEX IF NOT EXISTS idx_marriage_person2 '
+              'ON Marriage(person2_id, person1_id, year, is_current)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_parent_child_child '
+              'ON ParentChild(child_id, parent_id, role)')
+
+
+def create_closure_triggers(c):
+    """Index the closure table by descendant and keep it in step with inserts
+
+    A new parent-child edge links every ancestor of the parent (and the parent)
+    to every descendant of the child (and the child); a pair already linked
+    keeps the shorter depth. Replacing an edge by itself changes nothing.
+    Edges removed or changed afterwards need refresh_closure.
+    """
+    c.execute('CREATE INDEX IF NOT EXISTS idx_closure_descendant '
+              'ON PersonClosure(descendant_id, ancestor_id, depth)')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS closure_person_insert AFTER INSERT ON Person
+    BEGIN
+        INSERT OR IGNORE INTO PersonClosure VALUES (NEW.id, NEW.id, 0);
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS closure_edge_insert AFTER INSERT ON ParentChild
+    BEGIN
+        INSERT OR IGNORE INTO PersonClosure
+        VALUES (NEW.parent_id, NEW.parent_id, 0), (NEW.child_id, NEW.child_id, 0);
+        INSERT INTO PersonClosure (ancestor_id, descendant_id, depth)
+        SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1
+        FROM PersonClosure a, PersonClosure d
+        WHERE a.descendant_id = NEW.parent_id AND d.ancestor_id = NEW.child_id
+        ON CONFLICT (ancestor_id, descendant_id)
+        DO UPDATE SET depth = MIN(depth, excluded.depth);
+    END
+    ''')
 
-    conn.commit()
-    conn.close()
 
-    print(f"Database schema created at {db_path}")
-    return db_path
+def row_hash(row):
+    """Signed 64-bit content hash of the PERSON_COLUMNS values of a row"""
+    digest = hashlib.blake2b(repr(row).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def person_row(person):
+    """Person table row (PERSON_ROW_COLUMNS) of an exported person record"""
+    row = [person[column] for column in PERSON_COLUMNS]
+    # Convert boolean is_deceased to integer for SQLite
+    row[IS_DECEASED_COLUMN] = 1 if person['is_deceased'] else 0
+    row.append(row_hash(row))
+    return row
+
+
+def marriage_row(marriage):
+    """Marriage table row of an exported marriage record"""
+    return (marriage['person1_id'], marriage['person2_id'], marriage['year'],
+            1 if marriage['current'] else 0)
+
+
+def parent_child_rows(person):
+    """ParentChild table rows of the known parents of an exported person record"""
+    return [(person[role + '_id'], person['id'], role)
+            for role in ('father', 'mother') if person[role + '_id'] is not None]
+
+
+def insert_sql(table, columns):
+    return (f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})")
+
+
+class BatchInserter:
+    """Collects rows per statement and runs them BATCH_SIZE at a time
+
+    `seconds` holds the time spent running each statement.
+    """
+
+    def __init__(self, c):
+        self.c = c
+        self.batches = {}
+        self.seconds = {}
+
+    def add(self, sql, row):
+        batch = self.batches.setdefault(sql, [])
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            self._execute(sql, batch)
+
+    def flush(self):
+        for sql, batch in self.batches.items():
+            if batch:
+                self._execute(sql, batch)
 
+    def _execute(self, sql, batch):
+        start = time.perf_counter()
+        self.c.executemany(sql, batch)
+        self.seconds[sql] = self.seconds.get(sql, 0.0) + time.perf_counter() - start
+        batch.clear()
 
-def import_from_json(json_path, db_path):
-    """Import family tree data from JSON into SQLite database"""
-    # Load the JSON data
-    with open(json_path, 'r') as f:
-        data = json.load(f)
 
+DELETE_PARENT_CHILD = 'DELETE FROM ParentChild WHERE child_id = ?'
+
+
+def relink_parents(inserter, relinked):
+    """Replace the parent-child rows of people whose parents changed
+
+    `relinked` maps person IDs to their new parent_child_rows. Batches run
+    per statement, so pending rows are written first and the old links are
+    deleted before the new ones are added.
+    """
+    inserter.flush()
+    for pid in relinked:
+        inserter.add(DELETE_PARENT_CHILD, (pid,))
+    inserter.flush()
+    insert_parent_child = insert_sql('ParentChild', PARENT_CHILD_COLUMNS)
+    for edges in relinked.values():
+        for edge in edges:
+            inserter.add(insert_parent_child, edge)
+    inserter.flush()
+
+
+def import_from_json(json_path, db_path, bulk=False):
+    """Import family tree data from JSON into SQLite database
+
+    The file (JSON or NDJSON, optionally compressed) is parsed record by
+    record; people, their parent links and marriages are inserted in batches
+    within a single transaction,
+    so memory use does not depend on the size of the tree. `bulk` is
+    meant for loading a fresh database created without indexes: the load runs
+    with WAL journaling and without syncing, then the indexes (and the closure
+    table, if the schema has one) are built and ANALYZE gathers statistics for
+    the query planner. Otherwise people already in the database are
+    updated, and the parent links of those whose parents changed are
+    replaced (along with their closure table rows).
+    """
     # Connect to the database
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-
-    # Insert each person
-    for person in data['people']:
-        # Convert boolean is_deceased to integer for SQLite
-        is_deceased = 1 if person['is_deceased'] else 0
-
-        c.execute('''
-        INSERT OR REPLACE INTO Person (
-            id, first_name, middle_name, last_name, maiden_name,
-            date_of_birth, sex, blood_type, nationality, ethnicity,
-            place_of_birth, date_of_death, is_deceased, cause_of_death,
-            height_cm, eye_color, hair_color, email, phone,
-            address, occupation, education, religion, notes,
-            legacy_bucket_id, father_id, mother_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            person['id'], person['first_name'], person['middle_name'], person['last_name'], person['maiden_name'],
-            person['date_of_birth'], person['sex'], person['blood_type'], person['nationality'], person['ethnicity'],
-            person['place_of_birth'], person['date_of_death'], is_deceased, person['cause_of_death'],
-            person['height_cm'], person['eye_color'], person['hair_color'], person['email'], person['phone'],
-            person['address'], person['occupation'], person['education'], person['religion'], person['notes'],
-            person['legacy_bucket_id'], person['father_id'], person['mother_id']
-        ))
-
+    if bulk:
+        journal_mode = c.execute('PRAGMA journal_mode').fetchone()[0]
+        c.execute('PRAGMA journal_mode = WAL')
+        c.execute('PRAGMA synchronous = OFF')
+        c.execute('PRAGMA cache_size = -65536')  # 64 MB for the primary key B-tree
+
+    insert_person = insert_sql('Person', PERSON_ROW_COLUMNS)
+    insert_parent_child = insert_sql('ParentChild', PARENT_CHILD_COLUMNS)
+    insert_marriage = insert_sql('Marriage', MARRIAGE_COLUMNS)
+    inserter = BatchInserter(c)
+    relinked = {}  # Maps people already stored with other parents to their new parent-child rows
+    for kind, record in iter_records(json_path):
+        if kind == 'person':
+            inserter.add(insert_person, person_row(record))
+            if not bulk:
+                # An upsert: replacing the parent-child rows would keep links to former parents
+                old = conn.execute('SELECT father_id, mother_id FROM Person WHERE id = ?',
+                                   (record['id'],)).fetchone()
+                if old is not None and old != (record['father_id'], record['mother_id']):
+                    relinked[record['id']] = parent_child_rows(record)
+                    continue
+            for row in parent_child_rows(record):
+                inserter.add(insert_parent_child, row)
+        else:
+            inserter.add(insert_marriage, marriage_row(record))
+    relink_parents(inserter, relinked)
+    if relinked and has_closure(conn):
+        refresh_closure(conn, relinked)
     conn.commit()
 
+    if bulk:
+        create_indexes(c)
+        if has_closure(conn):
+            build_closure(conn)
+        c.execute('ANALYZE')
+        conn.commit()
+        c.execute(f'PRAGMA journal_mode = {journal_mode}')
+
     # Verify import
     c.execute("SELECT COUNT(*) FROM Person")
     count = c.fetchone()[0]
@@ -104,38 +332,365 @@ def import_from_json(json_path, db_path):
     return count
 
 
-def export_to_json(db_path, json_path):
-    """Export family tree data from SQLite database to JSON"""
-    # Connect to the database
+def sync_from_json(json_path, db_path):
+    """Bring an existing database in line with a JSON tree, writing only what changed
+
+    People are matched by ID and compared by row_hash: new people are
+    inserted, changed ones updated in place (keeping their row order) and
+    people missing from the file deleted, along with their parent links;
+    marriages are matched by spouses and year. Everything is applied in one
+    transaction. A closure table is kept in step. Returns the counts of
+    each kind of change and the seconds spent applying them.
+    """
+    start = time.perf_counter()
     conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
     c = conn.cursor()
+    columns = [row[1] for row in c.execute('PRAGMA table_info(Person)')]
+    if 'row_hash' not in columns:
+        # Databases imported before row hashes existed: every person is updated once
+        c.execute('ALTER TABLE Person ADD COLUMN row_hash INTEGER')
+
+    # Hash and parents of everyone in the database, by ID
+    existing = {pid: (hash_value, father_id, mother_id) for pid, hash_value, father_id, mother_id
+                in c.execute('SELECT id, row_hash, father_id, mother_id FROM Person')}
+    existing_marriages = {
+        (person1_id, person2_id, year): (marriage_id, is_current)
+        for marriage_id, person1_id, person2_id, year, is_current
+        in c.execute(f"SELECT id, {', '.join(MARRIAGE_COLUMNS)} FROM Marriage")}
+    closure = has_closure(conn)
+
+    insert_person = insert_sql('Person', PERSON_ROW_COLUMNS)
+    update_person = (f"UPDATE Person SET {', '.join(f'{column} = ?' for column in PERSON_ROW_COLUMNS[1:])} "
+                     f"WHERE id = ?")
+    delete_person = 'DELETE FROM Person WHERE id = ?'
+    insert_parent_child = insert_sql('ParentChild', PARENT_CHILD_COLUMNS)
+    insert_marriage = insert_sql('Marriage', MARRIAGE_COLUMNS)
+    update_marriage = 'UPDATE Marriage SET is_current = ? WHERE id = ?'
+    delete_marriage = 'DELETE FROM Marriage WHERE id = ?'
+
+    people = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    marriages = dict(people)
+    relinked = {}  # Maps people whose parents changed to their new parent-child rows
+    inserter = BatchInserter(c)
+    for kind, record in iter_records(json_path):
+        if kind == 'person':
+            row = person_row(record)
+            old = existing.pop(row[0], None)
+            if old is None:
+                inserter.add(insert_person, row)
+                for edge in parent_child_rows(record):
+                    inserter.add(insert_parent_child, edge)
+                people['inserted'] += 1
+            elif old[0] != row[-1]:
+                inserter.add(update_person, row[1:] + row[:1])
+                if old[1:] != (record['father_id'], record['mother_id']):
+                    relinked[row[0]] = parent_child_rows(record)
+                people['updated'] += 1
+            else:
+                people['unchanged'] += 1
+        else:
+            row = marriage_row(record)
+            old = existing_marriages.pop(row[:3], None)
+            if old is None:
+                inserter.add(insert_marriage, row)
+                marriages['inserted'] += 1
+            elif old[1] != row[3]:
+                inserter.add(update_marriage, (row[3], old[0]))
+                marriages['updated'] += 1
+            else:
+                marriages['unchanged'] += 1
+
+    # Whatever is left in the database is gone from the file
+    for pid in existing:
+        inserter.add(delete_person, (pid,))
+        inserter.add(DELETE_PARENT_CHILD, (pid,))
+    people['deleted'] = len(existing)
+    for marriage_id, _ in existing_marriages.values():
+        inserter.add(delete_marriage, (marriage_id,))
+    marriages['deleted'] = len(existing_marriages)
+    relink_parents(inserter, relinked)
+
+    seconds = {'insert': 0.0, 'update': 0.0, 'delete': 0.0}
+    for sql, elapsed in inserter.seconds.items():
+        seconds[sql.split()[0].lower()] += elapsed
+    if closure and (relinked or existing):
+        # Descendants of deleted people lose the ancestors they had through them
+        closure_start = time.perf_counter()
+        refresh_closure(conn, list(relinked) + list(existing))
+        c.executemany("""
+        DELETE FROM PersonClosure
+        WHERE ancestor_id = ?1 AND descendant_id = ?1
+        AND NOT EXISTS (SELECT 1 FROM ParentChild WHERE parent_id = ?1)
+        """, ((pid,) for pid in existing))
+        seconds['closure'] = time.perf_counter() - closure_start
+    conn.commit()
+    conn.close()
+    seconds['total'] = time.perf_counter() - start
+
+    print(f"Synced {db_path}: {people['inserted']} people inserted, "
+          f"{people['updated']} updated, {people['deleted']} deleted, "
+          f"{people['unchanged']} unchanged; {marriages['inserted']} marriages inserted, "
+          f"{marriages['updated']} updated, {marriages['deleted']} deleted")
+    print("Seconds spent: " + ", ".join(f"{name} {value:.2f}" for name, value in seconds.items()))
+    return {'people': people, 'marriages': marriages, 'seconds': seconds}
+
+
+# People reached walking up the parent-child edges from a person, with the
+# fewest generations to each (the person themselves at depth 0)
+ANCESTORS_CTE = """
+WITH RECURSIVE up(id, depth) AS (
+    SELECT ?, 0
+    UNION
+    SELECT pc.parent_id, up.depth + 1
+    FROM up JOIN ParentChild pc ON pc.child_id = up.id
+    WHERE up.depth < ?
+)
+"""
+DESCENDANTS_CTE = """
+WITH RECURSIVE down(id, depth) AS (
+    SELECT ?, 0
+    UNION
+    SELECT pc.child_id, down.depth + 1
+    FROM down JOIN ParentChild pc ON pc.parent_id = down.id
+    WHERE down.depth < ?
+)
+"""
+UNLIMITED_DEPTH = 1 << 30
+
+
+def has_closure(conn):
+    """Whether the database has a PersonClosure table"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'PersonClosure'"
+    ).fetchone() is not None
+
+
+def build_closure(conn):
+    """Fill the closure table from the parent-child edges in one pass
+
+    Meant to run once after a bulk import; its index and triggers are
+    created afterwards, so the table is written without maintaining them.
+    """
+    c = conn.cursor()
+    c.execute('DELETE FROM PersonClosure')
+    c.execute("""
+    INSERT INTO PersonClosure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE up(ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM Person
+        UNION
+        SELECT parent_id, parent_id, 0 FROM ParentChild
+        UNION
+        SELECT pc.parent_id, up.descendant_id, up.depth + 1
+        FROM up JOIN ParentChild pc ON pc.child_id = up.ancestor_id
+    )
+    SELECT ancestor_id, descendant_id, MIN(depth)
+    FROM up
+    GROUP BY ancestor_id, descendant_id
+    """)
+    create_closure_triggers(c)
+    conn.commit()
+    count = c.execute('SELECT COUNT(*) FROM PersonClosure').fetchone()[0]
+    print(f"Built closure table with {count} ancestor-descendant pairs")
+    return count
 
-    # Get all people
-    c.execute("SELECT * FROM Person")
-    rows = c.fetchall()
-
-    # Convert to list of dictionaries
-    people = []
-    for row in rows:
-        person = dict(row)
-        # Convert integer is_deceased back to boolean for JSON
-        person['is_deceased'] = bool(person['is_deceased'])
-        people.append(person)
-
-    # Create JSON structure
-    data = {
-        'people': people
-    }
 
-    # Write to file
-    with open(json_path, 'w') as f:
-        json.dump(data, f, indent=2)
+def refresh_closure(conn, person_ids):
+    """Recompute the ancestors of people whose parent links changed
+
+    Their descendants' ancestors are recomputed too. Needed after edges are
+    deleted or replaced, which the closure triggers do not follow. Runs in
+    the current transaction, so it commits along with the edge changes.
+    """
+    c = conn.cursor()
+    c.execute('CREATE TEMP TABLE IF NOT EXISTS closure_refresh (id PRIMARY KEY)')
+    c.execute('DELETE FROM closure_refresh')
+    c.executemany("""
+    INSERT OR IGNORE INTO closure_refresh
+    SELECT descendant_id FROM PersonClosure WHERE ancestor_id = ?1
+    UNION SELECT ?1
+    """, ((person_id,) for person_id in person_ids))
+    c.execute("""
+    DELETE FROM PersonClosure
+    WHERE depth > 0 AND descendant_id IN (SELECT id FROM closure_refresh)
+    """)
+    c.execute("""
+    INSERT OR IGNORE INTO PersonClosure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE up(ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM closure_refresh
+        UNION
+        SELECT pc.parent_id, up.descendant_id, up.depth + 1
+        FROM up JOIN ParentChild pc ON pc.child_id = up.ancestor_id
+    )
+    SELECT ancestor_id, descendant_id, MIN(depth)
+    FROM up
+    GROUP BY ancestor_id, descendant_id
+    """)
 
-    conn.close()
 
-    print(f"Successfully exported {len(people)} people to {json_path}")
-    return len(people)
+def ancestors(conn, person_id, max_depth=None):
+    """(ancestor ID, depth) pairs of a person, parents at depth 1, nearest first"""
+    if has_closure(conn):
+        return conn.execute("""
+        SELECT ancestor_id, depth FROM PersonClosure
+        WHERE descendant_id = ? AND depth BETWEEN 1 AND ?
+        ORDER BY depth, ancestor_id
+        """, (person_id, max_depth or UNLIMITED_DEPTH)).fetchall()
+    return conn.execute(ANCESTORS_CTE + """
+    SELECT id, MIN(depth) FROM up WHERE depth > 0 GROUP BY id ORDER BY 2, 1
+    """, (person_id, max_depth or UNLIMITED_DEPTH)).fetchall()
+
+
+def descendants(conn, person_id, max_depth=None):
+    """(descendant ID, depth) pairs of a person, children at depth 1, nearest first"""
+    if has_closure(conn):
+        return conn.execute("""
+        SELECT descendant_id, depth FROM PersonClosure
+        WHERE ancestor_id = ? AND depth BETWEEN 1 AND ?
+        ORDER BY depth, descendant_id
+        """, (person_id, max_depth or UNLIMITED_DEPTH)).fetchall()
+    return conn.execute(DESCENDANTS_CTE + """
+    SELECT id, MIN(depth) FROM down WHERE depth > 0 GROUP BY id ORDER BY 2, 1
+    """, (person_id, max_depth or UNLIMITED_DEPTH)).fetchall()
+
+
+def common_ancestors(conn, person1_id, person2_id):
+    """(ancestor ID, depth from person 1, depth from person 2) of two people
+
+    Either person counts as their own ancestor at depth 0, so a parent is a
+    common ancestor of themselves and their child. Nearest first.
+    """
+    if has_closure(conn):
+        return conn.execute("""
+        SELECT a.ancestor_id, a.depth, b.depth
+        FROM PersonClosure a
+        JOIN PersonClosure b ON b.ancestor_id = a.ancestor_id AND b.descendant_id = ?
+        WHERE a.descendant_id = ?
+        ORDER BY a.depth + b.depth, a.ancestor_id
+        """, (person2_id, person1_id)).fetchall()
+    rows = {}
+    for index, person_id in enumerate((person1_id, person2_id)):
+        for ancestor_id, depth in conn.execute(ANCESTORS_CTE + """
+        SELECT id, MIN(depth) FROM up GROUP BY id
+        """, (person_id, UNLIMITED_DEPTH)):
+            rows.setdefault(ancestor_id, [None, None])[index] = depth
+    common = [(ancestor_id, depths[0], depths[1]) for ancestor_id, depths in rows.items()
+              if None not in depths]
+    return sorted(common, key=lambda row: (row[1] + row[2], row[0]))
+
+
+def are_related(conn, person1_id, person2_id):
+    """Whether two people share an ancestor or one descends from the other"""
+    return bool(common_ancestors(conn, person1_id, person2_id))
+
+
+def person_condition(birth_years=None, family_line=None):
+    """SQL condition on the Person table and its parameters, selecting people
+    born in the (first, last) `birth_years` and/or the `family_line` person
+    and their descendants"""
+    conditions, params = [], []
+    if birth_years is not None:
+        conditions.append('birth_year BETWEEN ? AND ?')
+        params.extend(birth_years)
+    if family_line is not None:
+        conditions.append(f'id IN ({DESCENDANTS_CTE} SELECT id FROM down)')
+        params.extend((family_line, UNLIMITED_DEPTH))
+    return ' AND '.join(conditions) or '1', params
+
+
+def check_person_columns(columns):
+    """Columns to export, all PERSON_COLUMNS by default; ValueError for unknown ones"""
+    columns = columns or PERSON_COLUMNS
+    unknown = [column for column in columns if column not in PERSON_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown Person columns {unknown}, expected some of {PERSON_COLUMNS}")
+    return columns
+
+
+def read_people(conn, columns=None, condition='1', params=()):
+    """Exported person records of the Person table in import order, fetched
+    BATCH_SIZE rows at a time
+
+    `columns` is a subset of PERSON_COLUMNS (all by default), `condition`
+    and `params` select the people (see person_condition).
+    """
+    columns = check_person_columns(columns)
+    c = conn.execute(
+        f"SELECT {', '.join(columns)} FROM Person WHERE {condition} ORDER BY rowid", params)
+    for rows in iter(lambda: c.fetchmany(BATCH_SIZE), []):
+        for row in rows:
+            person = dict(zip(columns, row))
+            if 'is_deceased' in person:
+                # Convert integer is_deceased back to boolean for JSON
+                person['is_deceased'] = bool(person['is_deceased'])
+            yield person
+
+
+def read_marriages(conn, condition=None, params=()):
+    """Exported marriage records of the Marriage table, in import order
+
+    With a person `condition` (see person_condition), only marriages of
+    which a spouse matches it.
+    """
+    where = ''
+    if condition is not None:
+        where = (f"WHERE person1_id IN (SELECT id FROM Person WHERE {condition}) "
+                 f"OR person2_id IN (SELECT id FROM Person WHERE {condition})")
+        params = list(params) * 2
+    c = conn.execute(
+        f"SELECT {', '.join(MARRIAGE_COLUMNS)} FROM Marriage {where} ORDER BY id", params)
+    for rows in iter(lambda: c.fetchmany(BATCH_SIZE), []):
+        for person1_id, person2_id, year, is_current in rows:
+            yield {
+                'person1_id': person1_id,
+                'person2_id': person2_id,
+                'year': year,
+                'current': bool(is_current)
+            }
+
+
+def export_to_json(db_path, json_path, columns=None, birth_years=None, family_line=None,
+                   compact=None):
+    """Export family tree data from SQLite database to JSON
+
+    Rows are fetched in batches and streamed to the file, so memory use does
+    not depend on the size of the database. The file is NDJSON when its name
+    ends in .ndjson or .jsonl, and compressed when it ends in .gz or .zst
+    (see family_tree_writer). `columns` exports a subset of PERSON_COLUMNS;
+    `birth_years` (first, last) and `family_line` (a person ID, exported with
+    their descendants) select people, and then only the marriages of the
+    selected people are exported. `compact` defaults as for generated trees.
+    """
+    # Checked before the output file is opened, so a bad call leaves no partial file
+    columns = check_person_columns(columns)
+    condition, params = person_condition(birth_years, family_line)
+    filtered = birth_years is not None or family_line is not None
+
+    counts = {'people': 0, 'marriages': 0}
+
+    def counted(records, key):
+        for record in records:
+            counts[key] += 1
+            yield record
+
+    # Connect to the database
+    conn = sqlite3.connect(db_path)
+    try:
+        num_people = 0
+        if compact is None:
+            # The compact default depends on how many people are exported
+            num_people = conn.execute(
+                f"SELECT COUNT(*) FROM Person WHERE {condition}", params).fetchone()[0]
+        write_family_tree(
+            json_path,
+            counted(read_people(conn, columns, condition, params), 'people'),
+            counted(read_marriages(conn, condition if filtered else None, params), 'marriages'),
+            num_people, compact)
+    finally:
+        conn.close()
+
+    print(f"Successfully exported {counts['people']} people and {counts['marriages']} "
+          f"marriages to {json_path}")
+    return counts['people']
 
 
 def run_sample_queries(db_path):
@@ -154,19 +709,23 @@ def run_sample_queries(db_path):
     results['gender_distribution'] = {
         sex: count for sex, count in c.fetchall()}
 
-    # 3. Age distribution (living people)
+    # 3. Age distribution (living people), counted per birth year on the index
     c.execute("""
     SELECT 
         CASE 
-            WHEN (strftime('%Y', 'now') - strftime('%Y', date_of_birth)) < 18 THEN 'Under 18'
-            WHEN (strftime('%Y', 'now') - strftime('%Y', date_of_birth)) BETWEEN 18 AND 30 THEN '18-30'
-            WHEN (strftime('%Y', 'now') - strftime('%Y', date_of_birth)) BETWEEN 31 AND 50 THEN '31-50'
-            WHEN (strftime('%Y', 'now') - strftime('%Y', date_of_birth)) BETWEEN 51 AND 70 THEN '51-70'
+            WHEN age < 18 THEN 'Under 18'
+            WHEN age BETWEEN 18 AND 30 THEN '18-30'
+            WHEN age BETWEEN 31 AND 50 THEN '31-50'
+            WHEN age BETWEEN 51 AND 70 THEN '51-70'
             ELSE 'Over 70'
         END as age_group,
-        COUNT(*) as count
-    FROM Person
-    WHERE is_deceased = 0
+        SUM(count) as count
+    FROM (
+        SELECT CAST(strftime('%Y', 'now') AS INTEGER) - birth_year as age, COUNT(*) as count
+        FROM Person
+        WHERE is_deceased = 0
+        GROUP BY birth_year
+    )
     GROUP BY age_group
     ORDER BY 
         CASE age_group
@@ -205,25 +764,32 @@ def run_sample_queries(db_path):
         'unknown_both': unknown_stats[2]
     }
 
-    # 6. Distribution by decade of birth
+    # 6. Distribution by decade of birth, from per-year counts on the index
     c.execute("""
     SELECT 
-        (CAST(strftime('%Y', date_of_birth) AS INTEGER) / 10) * 10 as decade,
-        COUNT(*) as count
-    FROM Person
+        (birth_year / 10) * 10 as decade,
+        SUM(count) as count
+    FROM (
+        SELECT birth_year, COUNT(*) as count
+        FROM Person
+        GROUP BY is_deceased, birth_year
+    )
     GROUP BY decade
     ORDER BY decade
     """)
     results['birth_by_decade'] = {
         f"{decade}s": count for decade, count in c.fetchall()}
 
-    # 7. Find people with the most children
+    # 7. Find people with the most children (counted on the parent-child index)
     c.execute("""
-    SELECT p.id, p.first_name, p.last_name, COUNT(*) as num_children
-    FROM Person p
-    JOIN Person c ON c.father_id = p.id OR c.mother_id = p.id
-    GROUP BY p.id
-    ORDER BY num_children DESC
+    SELECT p.id, p.first_name, p.last_name, pc.num_children
+    FROM (
+        SELECT parent_id, COUNT(*) as num_children
+        FROM ParentChild
+        GROUP BY parent_id
+    ) pc
+    JOIN Person p ON p.id = pc.parent_id
+    ORDER BY pc.num_children DESC, pc.parent_id
     LIMIT 5
     """)
     results['most_children'] = [
@@ -231,6 +797,11 @@ def run_sample_queries(db_path):
         for row in c.fetchall()
     ]
 
+    # 8. Marriages, and how many are still current
+    c.execute("SELECT COUNT(*), COALESCE(SUM(is_current), 0) FROM Marriage")
+    total, current = c.fetchone()
+    results['marriages'] = {'total': total, 'current': current}
+
     # Close connection
     conn.close()
 
@@ -238,17 +809,27 @@ def run_sample_queries(db_path):
     return results
 
 
-def process_family_data(json_path='family_tree.json', db_path='family_tree.db'):
-    """Complete workflow to process family tree data"""
-    # Make sure we have a fresh database
-    if os.path.exists(db_path):
-        os.remove(db_path)
+def process_family_data(json_path='family_tree.json', db_path='family_tree.db', integer_ids=False,
+                        closure=False, sync=False):
+    """Complete workflow to process family tree data
+
+    With `sync`, an existing database is updated in place with only the
+    changed rows (see sync_from_json) and keeps its schema; otherwise it is
+    rebuilt from scratch.
+    """
+    sync_stats = None
+    if sync and os.path.exists(db_path):
+        sync_stats = sync_from_json(json_path, db_path)
+    else:
+        # Make sure we have a fresh database
+        if os.path.exists(db_path):
+            os.remove(db_path)
 
-    # Create database schema
-    create_database_schema(db_path)
+        # Create database schema, indexes are built after the bulk import
+        create_database_schema(db_path, integer_ids, indexes=False, closure=closure)
 
-    # Import data from JSON
-    import_from_json(json_path, db_path)
+        # Import data from JSON
+        import_from_json(json_path, db_path, bulk=True)
 
     # Run sample queries
     results = run_sample_queries(db_path)
@@ -259,6 +840,7 @@ def process_family_data(json_path='family_tree.json', db_path='family_tree.db'):
 
     return {
         'db_path': db_path,
+        'sync': sync_stats,
         'query_results': results,
         'exported_json': export_json_path
     }